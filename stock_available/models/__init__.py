@@ -2,6 +2,9 @@
 # Copyright 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from . import stock_available_snapshot
 from . import product_product
 from . import product_template
 from . import res_config_settings
+from . import stock_move
+from . import stock_quant
@@ -2,9 +2,20 @@
 # Copyright 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from odoo import api, fields, models
+from odoo import api, fields, models, _
 from odoo.addons import decimal_precision as dp
 from odoo.addons.stock.models.product import OPERATORS
+from odoo.exceptions import UserError
+from odoo.tools.float_utils import float_round
+
+from .stock_available_snapshot import MOVE_TODO_STATES
+
+QUANTITIES_CACHE = 'stock_available_quantities'
+# Context keys read by _get_domain_locations
+LOCATION_CONTEXT_KEYS = (
+    'location', 'warehouse', 'force_company', 'compute_child',
+    'company_owned',
+)
 
 
 class ProductProduct(models.Model):
@@ -17,12 +28,15 @@ class ProductProduct(models.Model):
 
     @api.multi
     def _compute_available_quantities_dict(self):
-        stock_dict = self._compute_quantities_dict(
-            self._context.get('lot_id'),
-            self._context.get('owner_id'),
-            self._context.get('package_id'),
-            self._context.get('from_date'),
-            self._context.get('to_date'))
+        if self._use_available_snapshot():
+            stock_dict = self._compute_quantities_dict_from_snapshot()
+        else:
+            stock_dict = self._compute_quantities_dict(
+                self._context.get('lot_id'),
+                self._context.get('owner_id'),
+                self._context.get('package_id'),
+                self._context.get('from_date'),
+                self._context.get('to_date'))
         res = {}
         for product in self:
             res[product.id] = {
@@ -32,6 +46,117 @@ class ProductProduct(models.Model):
             }
         return res, stock_dict
 
+    @api.model
+    def _use_available_snapshot(self):
+        """ The snapshot holds current quantities by location only: it
+        cannot answer for a lot, an owner, a package or a date range.
+        """
+        context = self.env.context
+        return (
+            self.env['stock.available.snapshot']._is_enabled() and
+            all(context.get(key) is None
+                for key in ('lot_id', 'owner_id', 'package_id')) and
+            not context.get('from_date') and
+            not context.get('to_date')
+        )
+
+    @api.model
+    def _get_quantities_cache(self, *args):
+        """ Return the quantities by product already computed in the current
+        transaction for the same user, location context and args.
+        :return: dict {product_id: quantities}
+        """
+        cr = self.env.cr
+        caches = cr.cache.get(QUANTITIES_CACHE)
+        if caches is None:
+            caches = cr.cache[QUANTITIES_CACHE] = {}
+            for event in ('commit', 'rollback'):
+                cr.after(event, self._invalidate_quantities_cache)
+        key = (self.env.uid, self.env.user.company_id.id) + tuple(
+            repr(self.env.context.get(name))
+            for name in LOCATION_CONTEXT_KEYS
+        ) + tuple(repr(arg) for arg in args)
+        return caches.setdefault(key, {})
+
+    @api.model
+    def _invalidate_quantities_cache(self):
+        """ Called whenever quants or moves change """
+        self.env.cr.cache.pop(QUANTITIES_CACHE, None)
+
+    @api.multi
+    def _get_cached_quantities(self, compute, *args):
+        """ Return compute(products) for the products, computing only the
+        ones not in the cache of the current transaction.
+        :param compute: function returning {product_id: quantities}
+        :param args: the arguments the quantities depend on, besides the
+            user and the location context
+        """
+        if len(self.ids) != len(self):
+            # New records cannot be cached
+            return compute(self)
+        cache = self._get_quantities_cache(*args)
+        missing = [product_id for product_id in self.ids
+                   if product_id not in cache]
+        if missing:
+            cache.update(compute(self.browse(missing)))
+        # Copies, so that the callers cannot alter the cache
+        return {
+            product_id: dict(cache[product_id]) for product_id in self.ids
+        }
+
+    @api.multi
+    def _compute_quantities_dict(self, lot_id, owner_id, package_id,
+                                 from_date=False, to_date=False):
+        """ Share the quantities between immediately_usable_qty and the
+        stock fields, and between the products and their BoM components
+        """
+        return self._get_cached_quantities(
+            lambda products: super(
+                ProductProduct, products)._compute_quantities_dict(
+                    lot_id, owner_id, package_id, from_date, to_date),
+            lot_id, owner_id, package_id, from_date, to_date)
+
+    @api.multi
+    def _compute_quantities_dict_from_snapshot(self):
+        """ Quantities like _compute_quantities_dict, read from the snapshot.
+        The snapshot does not know which moves stay inside the locations of
+        the context: a move between two of them is counted in incoming_qty
+        and in outgoing_qty too. qty_available and virtual_available are
+        the same as _compute_quantities_dict.
+        """
+        return self._get_cached_quantities(
+            lambda products: products._read_quantities_from_snapshot(),
+            'snapshot')
+
+    @api.multi
+    def _read_quantities_from_snapshot(self):
+        domain = [('product_id', 'in', self.ids)]
+        domain += self._get_domain_locations()[0]
+        groups = self.env['stock.available.snapshot'].read_group(
+            domain,
+            ['product_id', 'qty_on_hand', 'qty_incoming', 'qty_outgoing'],
+            ['product_id'])
+        sums = {group['product_id'][0]: group for group in groups}
+        res = {}
+        for product in self.with_context(prefetch_fields=False):
+            rounding = product.uom_id.rounding
+            group = sums.get(product.id, {})
+            qty_available = float_round(
+                group.get('qty_on_hand', 0.0), precision_rounding=rounding)
+            incoming_qty = float_round(
+                group.get('qty_incoming', 0.0), precision_rounding=rounding)
+            outgoing_qty = float_round(
+                group.get('qty_outgoing', 0.0), precision_rounding=rounding)
+            res[product.id] = {
+                'qty_available': qty_available,
+                'incoming_qty': incoming_qty,
+                'outgoing_qty': outgoing_qty,
+                'virtual_available': float_round(
+                    qty_available + incoming_qty - outgoing_qty,
+                    precision_rounding=rounding),
+            }
+        return res
+
     @api.multi
     @api.depends('virtual_available')
     def _compute_available_quantities(self):
@@ -60,17 +185,149 @@ class ProductProduct(models.Model):
     @api.model
     def _search_immediately_usable_qty(self, operator, value):
         """ Search function for the immediately_usable_qty field.
-        The search is quite similar to the Odoo search about quantity available
-        (addons/stock/models/product.py,253; _search_product_quantity function)
+        The quantities are aggregated in SQL from the same quants and moves
+        as _compute_quantities_dict, so that no product is loaded to filter.
         :param operator: str
         :param value: str
         :return: list of tuple (domain)
         """
-        products = self.search([])
-        # Force prefetch
-        products.mapped("immediately_usable_qty")
-        product_ids = []
-        for product in products:
-            if OPERATORS[operator](product.immediately_usable_qty, value):
-                product_ids.append(product.id)
-        return [('id', 'in', product_ids)]
+        self._check_qty_search_args(operator, value)
+        query, params = self._get_immediately_usable_qty_query()
+        query = """
+            SELECT q.product_id FROM (%s) q
+            WHERE q.stock_qty + q.potential_qty %s %%s
+        """ % (query, operator)
+        return [('id', 'inselect', (query, params + [value]))]
+
+    @api.model
+    def _check_qty_search_args(self, operator, value):
+        if operator not in OPERATORS:
+            raise UserError(_('Invalid domain operator %s') % operator)
+        if not isinstance(value, (float, int)):
+            raise UserError(_('Invalid domain right operand %s') % value)
+
+    @api.model
+    def _get_qty_sql_term(self, model_name, domain, qty_field, sign=1):
+        """ Return a SQL term selecting (product_id, quantity) rows of the
+        records of model_name matching domain, access rules applied.
+        :return: tuple (query, params)
+        """
+        model = self.env[model_name]
+        query = model._where_calc(domain)
+        model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, params = query.get_sql()
+        sql = 'SELECT "%s".product_id, %d * "%s"."%s" AS quantity FROM %s' % (
+            model._table, sign, model._table, qty_field, from_clause)
+        if where_clause:
+            sql += ' WHERE %s' % where_clause
+        return sql, params
+
+    @api.model
+    def _get_immediately_usable_qty_terms(self):
+        """ Return the SQL terms adding up to the stock part of
+        immediately_usable_qty, following _compute_quantities_dict.
+        Each term selects (product_id, quantity) rows. Modules changing the
+        definition of the quantity available to promise can add their own.
+        :return: list of tuple (query, params)
+        """
+        if self._use_available_snapshot():
+            return [self._get_qty_sql_term(
+                'stock.available.snapshot',
+                self._get_domain_locations()[0],
+                'qty_available_to_promise')]
+        context = self.env.context
+        lot_id = context.get('lot_id')
+        owner_id = context.get('owner_id')
+        package_id = context.get('package_id')
+        from_date = context.get('from_date')
+        to_date = fields.Datetime.to_datetime(context.get('to_date'))
+        dates_in_the_past = to_date and to_date < fields.Datetime.now()
+
+        domain_quant, domain_move_in, domain_move_out = \
+            self._get_domain_locations()
+        if lot_id is not None:
+            domain_quant = domain_quant + [('lot_id', '=', lot_id)]
+        if owner_id is not None:
+            domain_quant = domain_quant + [('owner_id', '=', owner_id)]
+            domain_move_in = domain_move_in + [
+                ('restrict_partner_id', '=', owner_id)]
+            domain_move_out = domain_move_out + [
+                ('restrict_partner_id', '=', owner_id)]
+        if package_id is not None:
+            domain_quant = domain_quant + [('package_id', '=', package_id)]
+        domain_move_in_done = list(domain_move_in)
+        domain_move_out_done = list(domain_move_out)
+        if from_date:
+            domain_move_in = domain_move_in + [('date', '>=', from_date)]
+            domain_move_out = domain_move_out + [('date', '>=', from_date)]
+        if to_date:
+            domain_move_in = domain_move_in + [('date', '<=', to_date)]
+            domain_move_out = domain_move_out + [('date', '<=', to_date)]
+
+        todo = [('state', 'in', MOVE_TODO_STATES)]
+        terms = [
+            self._get_qty_sql_term('stock.quant', domain_quant, 'quantity'),
+            self._get_qty_sql_term(
+                'stock.move', todo + domain_move_in, 'product_qty'),
+            self._get_qty_sql_term(
+                'stock.move', todo + domain_move_out, 'product_qty', -1),
+        ]
+        if dates_in_the_past:
+            # Quants are the current stock, roll back the moves done since
+            done = [('state', '=', 'done'), ('date', '>', to_date)]
+            terms += [
+                self._get_qty_sql_term(
+                    'stock.move', done + domain_move_in_done,
+                    'product_qty', -1),
+                self._get_qty_sql_term(
+                    'stock.move', done + domain_move_out_done,
+                    'product_qty'),
+            ]
+        return terms
+
+    @api.model
+    def _get_potential_qty_terms(self):
+        """ Return the SQL terms adding up to potential_qty.
+        Each term selects (product_id, quantity) rows.
+        :return: list of tuple (query, params)
+        """
+        return []
+
+    @api.model
+    def _sum_qty_sql_terms(self, terms):
+        """ Sum the (product_id, quantity) rows of terms by product """
+        if not terms:
+            return 'SELECT NULL::integer AS product_id, 0.0 AS quantity ' \
+                   'WHERE FALSE', []
+        query = """
+            SELECT t.product_id, SUM(t.quantity) AS quantity
+            FROM (%s) t GROUP BY t.product_id
+        """ % ' UNION ALL '.join('(%s)' % term for term, dummy in terms)
+        return query, [param for dummy, params in terms for param in params]
+
+    @api.model
+    def _get_immediately_usable_qty_query(self):
+        """ Return a query giving, for every product, the stock part of
+        immediately_usable_qty rounded to its unit of measure and its
+        potential_qty.
+        :return: tuple (query, params)
+        """
+        stock_query, stock_params = self._sum_qty_sql_terms(
+            self._get_immediately_usable_qty_terms())
+        potential_query, potential_params = self._sum_qty_sql_terms(
+            self._get_potential_qty_terms())
+        query = """
+            SELECT pp.id AS product_id,
+                   pp.product_tmpl_id,
+                   pp.active,
+                   ROUND(COALESCE(s.quantity, 0.0)::numeric
+                         / u.rounding::numeric) * u.rounding::numeric
+                       AS stock_qty,
+                   COALESCE(p.quantity, 0.0)::numeric AS potential_qty
+            FROM product_product pp
+            JOIN product_template pt ON pt.id = pp.product_tmpl_id
+            JOIN uom_uom u ON u.id = pt.uom_id
+            LEFT JOIN (%s) s ON s.product_id = pp.id
+            LEFT JOIN (%s) p ON p.product_id = pp.id
+        """ % (stock_query, potential_query)
+        return query, stock_params + potential_params
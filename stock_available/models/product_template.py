@@ -4,7 +4,6 @@
 
 from odoo import models, fields, api
 from odoo.addons import decimal_precision as dp
-from odoo.addons.stock.models.product import OPERATORS
 
 
 class ProductTemplate(models.Model):
@@ -20,19 +19,54 @@ class ProductTemplate(models.Model):
                 if key in product._fields:
                     product[key] = value
 
+    @api.multi
+    def _get_variant_ids_by_template(self):
+        """ Return the ids of the variants of each template, from a single
+        query grouped on the template, access rules applied.
+        :return: dict {template_id: [variant ids]}
+        """
+        variant_ids = {template.id: [] for template in self}
+        if self.ids:
+            product_model = self.env['product.product']
+            query = product_model._where_calc(
+                [('product_tmpl_id', 'in', self.ids)])
+            product_model._apply_ir_rules(query, 'read')
+            from_clause, where_clause, params = query.get_sql()
+            self.env.cr.execute("""
+                SELECT product_product.product_tmpl_id,
+                       array_agg(product_product.id)
+                FROM %s WHERE %s
+                GROUP BY product_product.product_tmpl_id
+            """ % (from_clause, where_clause or 'TRUE'), params)
+            variant_ids.update(self.env.cr.fetchall())
+        for template in self:
+            if not template.id:
+                # New templates are not in the database yet
+                variant_ids[template.id] = template.product_variant_ids.ids
+        return variant_ids
+
     @api.multi
     def _compute_available_quantities_dict(self):
-        variants_dict, _ = self.mapped(
-            'product_variant_ids')._compute_available_quantities_dict()
+        """ Add up the quantities of the variants of all the templates,
+        computed in one batch. The sums are made here rather than in SQL as
+        the quantities of the variants may come from Python overrides, like
+        the potential of stock_available_mrp.
+        """
+        variant_ids = self._get_variant_ids_by_template()
+        variants_dict, _ = self.env['product.product'].browse([
+            variant_id for ids in variant_ids.values() for variant_id in ids
+        ])._compute_available_quantities_dict()
         res = {}
         for template in self:
-            immediately_usable_qty = sum(
-                [variants_dict[p.id]["immediately_usable_qty"] -
-                 variants_dict[p.id]["potential_qty"] for p in
-                 template.product_variant_ids])
-            potential_qty = max(
-                [variants_dict[p.id]["potential_qty"] for p in
-                 template.product_variant_ids] or [0.0])
+            immediately_usable_qty = 0.0
+            potential_qty = 0.0
+            for variant_id in variant_ids[template.id]:
+                variant_qties = variants_dict[variant_id]
+                immediately_usable_qty += (
+                    variant_qties["immediately_usable_qty"] -
+                    variant_qties["potential_qty"])
+                potential_qty = max(
+                    potential_qty, variant_qties["potential_qty"])
             res[template.id] = {
                 "immediately_usable_qty": immediately_usable_qty +
                 potential_qty,
@@ -61,17 +95,20 @@ class ProductTemplate(models.Model):
     @api.model
     def _search_immediately_usable_qty(self, operator, value):
         """ Search function for the immediately_usable_qty field.
-        The search is quite similar to the Odoo search about quantity available
-        (addons/stock/models/product.py,253; _search_product_quantity function)
+        The quantities of the variants are aggregated in SQL the same way as
+        _compute_available_quantities_dict does.
         :param operator: str
         :param value: str
         :return: list of tuple (domain)
         """
-        products = self.search([])
-        # Force prefetch
-        products.mapped("immediately_usable_qty")
-        product_ids = []
-        for product in products:
-            if OPERATORS[operator](product.immediately_usable_qty, value):
-                product_ids.append(product.id)
-        return [('id', 'in', product_ids)]
+        product_model = self.env['product.product']
+        product_model._check_qty_search_args(operator, value)
+        query, params = product_model._get_immediately_usable_qty_query()
+        query = """
+            SELECT pt.id FROM product_template pt
+            LEFT JOIN (%s) q ON q.product_tmpl_id = pt.id AND q.active
+            GROUP BY pt.id
+            HAVING COALESCE(SUM(q.stock_qty), 0.0)
+                + COALESCE(MAX(q.potential_qty), 0.0) %s %%s
+        """ % (query, operator)
+        return [('id', 'inselect', (query, params + [value]))]
@@ -52,18 +52,36 @@ class ResConfigSettings(models.TransientModel):
              "Only the quantity fields have meaning for computing stock",
     )
 
+    stock_available_use_snapshot = fields.Boolean(
+        string='Keep a snapshot of the quantities',
+        help="Maintain the quantities by product and location in a table "
+             "updated on every quant and move change, and read the "
+             "quantities available to promise from it instead of "
+             "aggregating the quants and the moves.")
+
     @api.model
     def get_values(self):
         res = super(ResConfigSettings, self).get_values()
-        res.update(stock_available_mrp_based_on=self.env[
-            'ir.config_parameter'].sudo().get_param(
+        icp = self.env['ir.config_parameter'].sudo()
+        res.update(
+            stock_available_mrp_based_on=icp.get_param(
                 'stock_available_mrp_based_on',
-                'qty_available')
+                'qty_available'),
+            stock_available_use_snapshot=bool(icp.get_param(
+                'stock_available_use_snapshot')),
         )
         return res
 
     @api.multi
     def set_values(self):
         super(ResConfigSettings, self).set_values()
-        self.env['ir.config_parameter'].sudo().set_param(
+        icp = self.env['ir.config_parameter'].sudo()
+        icp.set_param(
             'stock_available_mrp_based_on', self.stock_available_mrp_based_on)
+        snapshot = self.env['stock.available.snapshot']
+        was_enabled = snapshot._is_enabled()
+        icp.set_param(
+            'stock_available_use_snapshot', self.stock_available_use_snapshot)
+        if self.stock_available_use_snapshot and not was_enabled:
+            # The snapshot was not maintained while disabled
+            snapshot._rebuild()
@@ -0,0 +1,186 @@
+# Copyright 2014 Numérigraphe
+# Copyright 2016 Sodexis
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from collections import defaultdict
+
+from odoo import api, fields, models
+from odoo.addons import decimal_precision as dp
+from odoo.tools.sql import create_unique_index
+
+MOVE_TODO_STATES = ('waiting', 'confirmed', 'assigned', 'partially_available')
+
+
+class StockAvailableSnapshot(models.Model):
+
+    """ Quantities by product, location and company.
+    When enabled in the settings, the table is maintained by deltas from the
+    quants and the moves, so that the quantity available to promise can be
+    read without aggregating them again.
+    """
+    _name = 'stock.available.snapshot'
+    _description = 'Stock available snapshot'
+
+    product_id = fields.Many2one(
+        'product.product',
+        string='Product',
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+    )
+    location_id = fields.Many2one(
+        'stock.location',
+        string='Location',
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete='cascade',
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Company',
+        readonly=True,
+        ondelete='cascade',
+    )
+    qty_on_hand = fields.Float(
+        string='On Hand',
+        digits=dp.get_precision('Product Unit of Measure'),
+        readonly=True,
+    )
+    qty_reserved = fields.Float(
+        string='Reserved',
+        digits=dp.get_precision('Product Unit of Measure'),
+        readonly=True,
+    )
+    qty_incoming = fields.Float(
+        string='Incoming',
+        digits=dp.get_precision('Product Unit of Measure'),
+        readonly=True,
+    )
+    qty_outgoing = fields.Float(
+        string='Outgoing',
+        digits=dp.get_precision('Product Unit of Measure'),
+        readonly=True,
+    )
+    qty_available_to_promise = fields.Float(
+        string='Available to promise',
+        digits=dp.get_precision('Product Unit of Measure'),
+        readonly=True,
+    )
+
+    @api.model_cr
+    def init(self):
+        create_unique_index(
+            self._cr, 'stock_available_snapshot_key_uniq', self._table,
+            ['product_id', 'location_id', 'COALESCE(company_id, 0)'])
+
+    @api.model
+    def _is_enabled(self):
+        return bool(self.env['ir.config_parameter'].sudo().get_param(
+            'stock_available_use_snapshot'))
+
+    @api.model
+    def _apply_deltas(self, deltas):
+        """ Add quantities to the snapshot
+        :param deltas: dict {(product_id, location_id, company_id):
+                             [on_hand, reserved, incoming, outgoing]}
+        """
+        cr = self.env.cr
+        rows = [
+            cr.mogrify(
+                "(%s, %s, %s, %s, %s, %s, %s, %s, "
+                "%s, now() at time zone 'UTC', %s, now() at time zone 'UTC')",
+                key + tuple(delta) + (
+                    delta[0] + delta[2] - delta[3], self.env.uid, self.env.uid
+                )).decode()
+            # Sorted to always lock the rows in the same order
+            for key, delta in sorted(
+                deltas.items(), key=lambda item: (
+                    item[0][0], item[0][1], item[0][2] or 0))
+            if any(delta)
+        ]
+        if not rows:
+            return
+        cr.execute("""
+            INSERT INTO stock_available_snapshot AS s (
+                product_id, location_id, company_id,
+                qty_on_hand, qty_reserved, qty_incoming, qty_outgoing,
+                qty_available_to_promise,
+                create_uid, create_date, write_uid, write_date)
+            VALUES %s
+            ON CONFLICT (product_id, location_id, COALESCE(company_id, 0))
+            DO UPDATE SET
+                qty_on_hand = s.qty_on_hand + EXCLUDED.qty_on_hand,
+                qty_reserved = s.qty_reserved + EXCLUDED.qty_reserved,
+                qty_incoming = s.qty_incoming + EXCLUDED.qty_incoming,
+                qty_outgoing = s.qty_outgoing + EXCLUDED.qty_outgoing,
+                qty_available_to_promise = s.qty_available_to_promise
+                    + EXCLUDED.qty_available_to_promise,
+                write_uid = EXCLUDED.write_uid,
+                write_date = EXCLUDED.write_date
+            RETURNING s.id
+        """ % ', '.join(rows))
+        self.invalidate_cache(
+            ['qty_on_hand', 'qty_reserved', 'qty_incoming', 'qty_outgoing',
+             'qty_available_to_promise'],
+            [row[0] for row in cr.fetchall()])
+
+    @api.model
+    def _update_from_quants(self, quants, sign=1):
+        deltas = defaultdict(lambda: [0.0, 0.0, 0.0, 0.0])
+        for quant in quants.sudo():
+            delta = deltas[(quant.product_id.id, quant.location_id.id,
+                            quant.company_id.id or None)]
+            delta[0] += sign * quant.quantity
+            delta[1] += sign * quant.reserved_quantity
+        self._apply_deltas(deltas)
+
+    @api.model
+    def _update_from_moves(self, moves, sign=1):
+        deltas = defaultdict(lambda: [0.0, 0.0, 0.0, 0.0])
+        for move in moves.sudo():
+            if move.state not in MOVE_TODO_STATES:
+                continue
+            company_id = move.company_id.id or None
+            deltas[(move.product_id.id, move.location_dest_id.id,
+                    company_id)][2] += sign * move.product_qty
+            deltas[(move.product_id.id, move.location_id.id,
+                    company_id)][3] += sign * move.product_qty
+        self._apply_deltas(deltas)
+
+    @api.model
+    def _rebuild(self):
+        """ Recompute the whole snapshot from the quants and the moves """
+        # Stored quantities of the moves may still be pending
+        self.recompute()
+        self.env.cr.execute("DELETE FROM stock_available_snapshot")
+        self.env.cr.execute("""
+            INSERT INTO stock_available_snapshot (
+                product_id, location_id, company_id,
+                qty_on_hand, qty_reserved, qty_incoming, qty_outgoing,
+                qty_available_to_promise,
+                create_uid, create_date, write_uid, write_date)
+            SELECT t.product_id, t.location_id, t.company_id,
+                   SUM(t.on_hand), SUM(t.reserved),
+                   SUM(t.incoming), SUM(t.outgoing),
+                   SUM(t.on_hand + t.incoming - t.outgoing),
+                   %(uid)s, now() at time zone 'UTC',
+                   %(uid)s, now() at time zone 'UTC'
+            FROM (
+                SELECT product_id, location_id, company_id,
+                       quantity AS on_hand, reserved_quantity AS reserved,
+                       0.0 AS incoming, 0.0 AS outgoing
+                FROM stock_quant
+                UNION ALL
+                SELECT product_id, location_dest_id, company_id,
+                       0.0, 0.0, product_qty, 0.0
+                FROM stock_move WHERE state IN %(states)s
+                UNION ALL
+                SELECT product_id, location_id, company_id,
+                       0.0, 0.0, 0.0, product_qty
+                FROM stock_move WHERE state IN %(states)s
+            ) t
+            GROUP BY t.product_id, t.location_id, t.company_id
+        """, {'uid': self.env.uid, 'states': MOVE_TODO_STATES})
+        self.invalidate_cache()
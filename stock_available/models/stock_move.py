@@ -0,0 +1,47 @@
+# Copyright 2014 Numérigraphe
+# Copyright 2016 Sodexis
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, models
+
+SNAPSHOT_FIELDS = (
+    'state', 'product_id', 'product_uom_qty', 'product_uom', 'product_qty',
+    'location_id', 'location_dest_id', 'company_id',
+)
+
+
+class StockMove(models.Model):
+
+    """ Keep the availability snapshot and cache up to date """
+    _inherit = 'stock.move'
+
+    @api.model
+    def create(self, vals):
+        move = super(StockMove, self).create(vals)
+        self.env['product.product']._invalidate_quantities_cache()
+        snapshot = self.env['stock.available.snapshot']
+        if snapshot._is_enabled():
+            snapshot._update_from_moves(move)
+        return move
+
+    @api.multi
+    def write(self, vals):
+        snapshot = self.env['stock.available.snapshot']
+        update = snapshot._is_enabled() and any(
+            field in vals for field in SNAPSHOT_FIELDS)
+        if update:
+            snapshot._update_from_moves(self, -1)
+        res = super(StockMove, self).write(vals)
+        self.env['product.product']._invalidate_quantities_cache()
+        if update:
+            snapshot._update_from_moves(self)
+        return res
+
+    @api.multi
+    def unlink(self):
+        snapshot = self.env['stock.available.snapshot']
+        if snapshot._is_enabled():
+            snapshot._update_from_moves(self, -1)
+        res = super(StockMove, self).unlink()
+        self.env['product.product']._invalidate_quantities_cache()
+        return res
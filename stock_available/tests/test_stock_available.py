@@ -2,6 +2,7 @@
 # Copyright 2016 Sodexis
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from odoo.exceptions import UserError
 from odoo.tests.common import TransactionCase
 
 
@@ -139,3 +140,178 @@ class TestStockLogisticsWarehouse(TransactionCase):
         # Potential Qty is set as 0.0 by default
         self.assertEquals(templateAB.potential_qty, 0.0)
         self.assertEquals(productA.potential_qty, 0.0)
+
+    def test02_search_invalid_operator(self):
+        """The search on immediately_usable_qty only accepts comparisons"""
+        for model in ('product.product', 'product.template'):
+            with self.assertRaises(UserError):
+                self.env[model].search(
+                    [('immediately_usable_qty', 'like', 1)])
+            with self.assertRaises(UserError):
+                self.env[model].search(
+                    [('immediately_usable_qty', '>', 'abc')])
+
+    def test03_snapshot(self):
+        """The snapshot gives the same quantities as the quants and moves"""
+        productObj = self.env['product.product']
+        moveObj = self.env['stock.move']
+        snapshotObj = self.env['stock.available.snapshot']
+        supplier_location = self.env.ref('stock.stock_location_suppliers')
+        stock_location = self.env.ref('stock.stock_location_stock')
+        customer_location = self.env.ref('stock.stock_location_customers')
+        product = productObj.create({
+            'name': 'product snapshot',
+            'type': 'product',
+        })
+        settings = self.env['res.config.settings'].create({})
+        settings.stock_available_use_snapshot = True
+        settings.set_values()
+        self.assertTrue(snapshotObj._is_enabled())
+
+        def check(value):
+            product.refresh()
+            self.assertTrue(productObj._use_available_snapshot())
+            self.assertEqual(product.immediately_usable_qty, value)
+            self.assertIn(product, productObj.search(
+                [('immediately_usable_qty', '=', value)]))
+            self.assertEqual(
+                product.with_context(
+                    lot_id=False).immediately_usable_qty, value)
+
+        move_in = moveObj.create({
+            'location_id': supplier_location.id,
+            'location_dest_id': stock_location.id,
+            'name': 'MOVE INCOMING -> STOCK',
+            'product_id': product.id,
+            'product_uom': product.uom_id.id,
+            'product_uom_qty': 5,
+        })
+        check(0)
+        move_in._action_confirm()
+        check(5)
+        move_in._action_done()
+        check(5)
+        move_out = moveObj.create({
+            'location_id': stock_location.id,
+            'location_dest_id': customer_location.id,
+            'name': 'MOVE STOCK -> CUSTOMER',
+            'product_id': product.id,
+            'product_uom': product.uom_id.id,
+            'product_uom_qty': 2,
+        })
+        move_out._action_confirm()
+        move_out._action_assign()
+        check(3)
+        snapshot = snapshotObj.search([
+            ('product_id', '=', product.id),
+            ('location_id', '=', stock_location.id),
+        ])
+        self.assertEqual(snapshot.qty_on_hand, 5)
+        self.assertEqual(snapshot.qty_reserved, 2)
+        self.assertEqual(snapshot.qty_outgoing, 2)
+        self.assertEqual(snapshot.qty_available_to_promise, 3)
+
+        # The rebuilt snapshot matches the incrementally maintained one
+        fields_list = ['product_id', 'location_id', 'company_id',
+                       'qty_on_hand', 'qty_reserved', 'qty_incoming',
+                       'qty_outgoing', 'qty_available_to_promise']
+        before = sorted(
+            [tuple(r[f] for f in fields_list)
+             for r in snapshotObj.search(
+                 [('product_id', '=', product.id)]).read(fields_list)])
+        snapshotObj._rebuild()
+        after = sorted(
+            [tuple(r[f] for f in fields_list)
+             for r in snapshotObj.search(
+                 [('product_id', '=', product.id)]).read(fields_list)])
+        self.assertEqual(before, after)
+
+        # A move inside the stock is both incoming and outgoing in the
+        # snapshot, and leaves the virtual stock unchanged
+        shelf_location = self.env['stock.location'].create({
+            'name': 'Shelf snapshot',
+            'location_id': stock_location.id,
+        })
+        move_internal = moveObj.create({
+            'location_id': stock_location.id,
+            'location_dest_id': shelf_location.id,
+            'name': 'MOVE STOCK -> SHELF',
+            'product_id': product.id,
+            'product_uom': product.uom_id.id,
+            'product_uom_qty': 1,
+        })
+        move_internal._action_confirm()
+        check(3)
+        from_snapshot = product._compute_quantities_dict_from_snapshot()[
+            product.id]
+        from_moves = product._compute_quantities_dict(
+            None, None, None)[product.id]
+        self.assertEqual(from_snapshot['qty_available'],
+                         from_moves['qty_available'])
+        self.assertEqual(from_snapshot['virtual_available'],
+                         from_moves['virtual_available'])
+        self.assertEqual(from_snapshot['incoming_qty'],
+                         from_moves['incoming_qty'] + 1)
+        self.assertEqual(from_snapshot['outgoing_qty'],
+                         from_moves['outgoing_qty'] + 1)
+
+    def test04_quantities_cache(self):
+        """The quantities are shared in the transaction until stock moves"""
+        product = self.env['product.product'].create({
+            'name': 'product cache',
+            'type': 'product',
+        })
+        stock_location = self.env.ref('stock.stock_location_stock')
+        cache = product._get_quantities_cache(None, None, None, None, None)
+        self.assertNotIn(product.id, cache)
+        self.assertEqual(product.immediately_usable_qty, 0)
+        cache = product._get_quantities_cache(None, None, None, None, None)
+        self.assertIn(product.id, cache)
+
+        self.env['stock.quant']._update_available_quantity(
+            product, stock_location, 4)
+        cache = product._get_quantities_cache(None, None, None, None, None)
+        self.assertNotIn(product.id, cache)
+        product.refresh()
+        self.assertEqual(product.immediately_usable_qty, 4)
+        self.assertEqual(product.qty_available, 4)
+
+        # The quantities of the company owned locations are cached apart
+        owned_product = product.with_context(company_owned=True)
+        cache = owned_product._get_quantities_cache(
+            None, None, None, None, None)
+        self.assertNotIn(product.id, cache)
+        self.assertEqual(owned_product.qty_available, 4)
+        self.assertIn(product.id, cache)
+
+    def test05_template_batch(self):
+        """The quantities of several multi-variant templates are added up
+        in one batch, archived variants left out"""
+        productObj = self.env['product.product']
+        stock_location = self.env.ref('stock.stock_location_stock')
+        templates = self.env['product.template']
+        variants = []
+        for name in ('templC', 'templD'):
+            template = self.env['product.template'].create({
+                'name': name,
+                'type': 'product',
+            })
+            templates |= template
+            variants.append(template.product_variant_id | productObj.create({
+                'name': name,
+                'type': 'product',
+                'product_tmpl_id': template.id,
+            }))
+        quantities = ((1.0, 2.0), (4.0, 8.0))
+        for products, qties in zip(variants, quantities):
+            for product, qty in zip(products, qties):
+                self.env['stock.quant']._update_available_quantity(
+                    product, stock_location, qty)
+        variants[1][1].active = False
+        res = templates._compute_available_quantities_dict()
+        self.assertEqual(res[templates[0].id]['immediately_usable_qty'], 3.0)
+        self.assertEqual(res[templates[1].id]['immediately_usable_qty'], 4.0)
+        self.assertEqual(res[templates[0].id]['potential_qty'], 0.0)
+        templates.refresh()
+        self.assertEqual(
+            templates.mapped('immediately_usable_qty'), [3.0, 4.0])
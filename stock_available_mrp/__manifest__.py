@@ -2,7 +2,7 @@
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 {
     'name': 'Consider the production potential is available to promise',
-    'version': '12.0.1.0.0',
+    'version': '12.0.1.1.0',
     "author": "Numérigraphe,"
               "Odoo Community Association (OCA)",
     'website': 'https://github.com/OCA/stock-logistics-warehouse',
@@ -1,4 +1,5 @@
 # Copyright 2014 Numérigraphe SARL
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
+from . import mrp_bom
 from . import product_product
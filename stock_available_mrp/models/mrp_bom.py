@@ -0,0 +1,45 @@
+# Copyright 2014 Numérigraphe SARL
+# License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
+
+from odoo import api, models
+
+
+class MrpBom(models.Model):
+
+    _inherit = 'mrp.bom'
+
+    @api.model
+    def create(self, vals):
+        # Drop the component needs cached in the transaction
+        self.env['product.product']._invalidate_bom_needs_cache()
+        return super(MrpBom, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        self.env['product.product']._invalidate_bom_needs_cache()
+        return super(MrpBom, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.env['product.product']._invalidate_bom_needs_cache()
+        return super(MrpBom, self).unlink()
+
+
+class MrpBomLine(models.Model):
+
+    _inherit = 'mrp.bom.line'
+
+    @api.model
+    def create(self, vals):
+        self.env['product.product']._invalidate_bom_needs_cache()
+        return super(MrpBomLine, self).create(vals)
+
+    @api.multi
+    def write(self, vals):
+        self.env['product.product']._invalidate_bom_needs_cache()
+        return super(MrpBomLine, self).write(vals)
+
+    @api.multi
+    def unlink(self):
+        self.env['product.product']._invalidate_bom_needs_cache()
+        return super(MrpBomLine, self).unlink()
@@ -1,9 +1,12 @@
 # Copyright 2014 Numérigraphe SARL
 # License AGPL-3.0 or later (http://www.gnu.org/licenses/agpl.html).
 
-from collections import Counter
+from collections import Counter, defaultdict
 from odoo import api, fields, models
 from odoo.fields import first
+from odoo.tools.float_utils import float_compare, float_round
+
+BOM_NEEDS_CACHE = 'stock_available_mrp_bom_needs'
 
 
 class ProductProduct(models.Model):
@@ -65,75 +68,328 @@ class ProductProduct(models.Model):
             'stock_available_mrp_based_on', 'qty_available'
         )
 
-        # explode all boms at once
-        exploded_boms = product_with_bom._explode_boms()
+        # If the qty is computed by the same method, the potential of the
+        # components having a BoM is part of their availability
+        recursive = bool(res) and \
+            stock_available_mrp_based_on in list(res.values())[0]
+
+        # Needs of one unit of each product, flattened once per BoM
+        component_needs = product_with_bom._get_bom_component_graph(
+            recursive=recursive)
 
         # extract the list of product used as bom component
-        component_products = self.env['product.product'].browse()
-        for exploded_components in exploded_boms.values():
-            for bom_component in exploded_components:
-                component_products |= first(bom_component).product_id
-
-        # Compute stock for product components.
-        # {'productid': {field_name: qty}}
-        if res and stock_available_mrp_based_on in list(res.values())[0]:
-            # If the qty is computed by the same method use it to avoid
-            # stressing the cache
-            component_qties, _ = \
-                component_products._compute_available_quantities_dict()
+        component_products = self.env['product.product'].browse(list({
+            component_id
+            for needs in component_needs.values()
+            for component_id, dummy in needs
+        }))
+
+        if recursive:
+            # Compute the stock of the whole BoM structure at once, then
+            # the potential of every product once, components first.
+            # {'productid': {field_name: qty}}
+            values = {}
+            others = component_products.filtered(lambda p: p.id not in res)
+            if others:
+                # Skip this override on purpose: the potential of the
+                # components is evaluated below over the whole graph, and
+                # adding it here too would count it twice.
+                values = super(
+                    ProductProduct, others
+                )._compute_available_quantities_dict()[0]
+            values.update(res)
+            self._evaluate_potential_qties(
+                component_needs, values, stock_available_mrp_based_on)
         else:
             # The qty is a field computed by an other method than the
             # current one. Take the value on the record.
-            component_qties = {
-                p.id: {
-                    stock_available_mrp_based_on: p[
-                        stock_available_mrp_based_on]} for p in
-                component_products}
-
-        for product in product_with_bom:
-            # Need by product (same product can be in many BOM lines/levels)
-            exploded_components = exploded_boms[product.id]
-            component_needs = product._get_components_needs(
-                exploded_components)
-            if not component_needs:
-                # The BoM has no line we can use
-                potential_qty = 0.0
-
-            else:
-                # Find the lowest quantity we can make with the stock at hand
-                components_potential_qty = min(
-                    [component_qties[component.id][
-                        stock_available_mrp_based_on] / need
-                     for component, need in component_needs.items()]
-                )
-
-                bom_id = product.bom_id
-                potential_qty = (bom_id.product_qty * components_potential_qty)
-                potential_qty = potential_qty > 0.0 and potential_qty or 0.0
-
-                # We want to respect the rounding factor of the potential_qty
-                # Rounding down as we want to be pesimistic.
-                potential_qty = bom_id.product_uom_id._compute_quantity(
-                    potential_qty,
-                    product.bom_id.product_tmpl_id.uom_id,
-                    rounding_method='DOWN'
-                )
-
-            res[product.id]['potential_qty'] = potential_qty
-            res[product.id]['immediately_usable_qty'] += potential_qty
+            availability = {
+                p.id: p[stock_available_mrp_based_on]
+                for p in component_products
+            }
+            potential_qties = product_with_bom._compute_potential_qties(
+                component_needs, availability)
+            for product_id, potential_qty in potential_qties.items():
+                res[product_id]['potential_qty'] = potential_qty
+                res[product_id]['immediately_usable_qty'] += potential_qty
 
         return res, stock_dict
 
     @api.multi
-    def _explode_boms(self):
+    def _get_bom_component_graph(self, recursive=False):
+        """ Return the needs of one unit of each product with a BoM.
+        If recursive, follow the components having a BoM too, so that the
+        result covers the whole BoM structure below the products.
+
+        :return: {product_id: ((component_id, need), ...)}
         """
-        return a dict by product_id of exploded bom lines
-        :return:
+        graph = {}
+        visited = set()
+        products = self
+        while products:
+            visited.update(products.ids)
+            for product in products.filtered('bom_id'):
+                graph[product.id] = product._get_bom_component_needs(
+                    product.bom_id.id, product.id)
+            if not recursive:
+                break
+            products = self.browse(list({
+                component_id
+                for product_id in products.ids if product_id in graph
+                for component_id, dummy in graph[product_id]
+            } - visited))
+        return graph
+
+    @api.model
+    def _evaluate_potential_qties(self, component_needs, values, based_on):
+        """ Add the potential of every product of component_needs to values,
+        layer by layer from the components, so that the potential of a
+        sub-assembly is computed once and reused by all the products using
+        it.
+
+        :param component_needs: {product_id: ((component_id, need), ...)}
+        :param values: {product_id: {field_name: qty}}, for all the products
+            and components of component_needs
         """
-        exploded_boms = {}
-        for rec in self:
-            exploded_boms[rec.id] = rec.bom_id.explode(rec, 1.0)[1]
-        return exploded_boms
+        # Stock of every product before adding any potential
+        stock = {
+            product_id: product_values[based_on]
+            for product_id, product_values in values.items()
+        }
+        # Components still to evaluate, by product
+        pending = {
+            product_id: {
+                component_id for component_id, dummy in needs
+                if component_id in component_needs
+            }
+            for product_id, needs in component_needs.items()
+        }
+        users = defaultdict(list)
+        for product_id, components in pending.items():
+            for component_id in components:
+                users[component_id].append(product_id)
+        layer = [
+            product_id for product_id, components in pending.items()
+            if not components
+        ]
+        while pending:
+            if not layer:
+                # BoM loop: use the stock of the remaining components only
+                layer = list(pending)
+            for product_id in layer:
+                del pending[product_id]
+            availability = {
+                component_id: values[component_id][based_on]
+                for product_id in layer
+                for component_id, dummy in component_needs[product_id]
+            }
+            potential_qties = self.browse(layer)._compute_potential_qties(
+                component_needs, availability)
+            layer = []
+            for product_id, potential_qty in potential_qties.items():
+                if potential_qty:
+                    potential_qty = self.browse(
+                        product_id)._net_shared_potential_qty(
+                            potential_qty, component_needs, stock)
+                values[product_id]['potential_qty'] = potential_qty
+                values[product_id]['immediately_usable_qty'] += potential_qty
+                for user_id in users[product_id]:
+                    components = pending.get(user_id)
+                    if components is None:
+                        continue
+                    components.discard(product_id)
+                    if not components:
+                        layer.append(user_id)
+
+    @api.model
+    def _sort_bom_subgraph(self, component_needs, product_id):
+        """ Return the products with a BoM below the product, itself
+        included, each one before its components, and whether a component is
+        reached through several paths.
+
+        :return: tuple (list of product ids, bool), or None on a BoM loop
+        """
+        order = []
+        parents = Counter()
+        visiting = set()
+        done = set()
+
+        def visit(node_id):
+            if node_id in done:
+                return True
+            if node_id in visiting:
+                return False
+            visiting.add(node_id)
+            for component_id, dummy in component_needs[node_id]:
+                parents[component_id] += 1
+                if component_id in component_needs and \
+                        not visit(component_id):
+                    return False
+            visiting.discard(node_id)
+            done.add(node_id)
+            order.append(node_id)
+            return True
+
+        if not visit(product_id):
+            return None
+        order.reverse()
+        return order, any(count > 1 for count in parents.values())
+
+    @api.multi
+    def _net_shared_potential_qty(self, potential_qty, component_needs,
+                                  stock):
+        """ Lower the potential of the product when a component is used by
+        several of its sub-assemblies, or by a sub-assembly and the product
+        itself: the layered evaluation counts the stock of such a component
+        once for each path leading to it.
+
+        :param potential_qty: the potential from the layered evaluation, an
+            upper bound
+        :param stock: {product_id: qty} before adding any potential
+        :return: the largest quantity the stock can actually supply
+        """
+        self.ensure_one()
+        subgraph = self._sort_bom_subgraph(component_needs, self.id)
+        if not subgraph or not subgraph[1]:
+            return potential_qty
+        order = subgraph[0]
+        # BoM batches needed to make one unit of each product
+        batch_factors = {}
+        for product in self.browse(order):
+            bom = product.bom_id
+            batch_factors[product.id] = bom.product_tmpl_id.uom_id \
+                ._compute_quantity(1.0, bom.product_uom_id, round=False) \
+                / bom.product_qty
+
+        def is_feasible(qty):
+            demand = defaultdict(float)
+            demand[self.id] = qty
+            for product_id in order:
+                to_make = demand.pop(product_id, 0.0)
+                if product_id != self.id:
+                    # Sub-assemblies are taken from the stock first
+                    to_make -= max(stock.get(product_id, 0.0), 0.0)
+                if to_make <= 0.0:
+                    continue
+                batches = to_make * batch_factors[product_id]
+                for component_id, need in component_needs[product_id]:
+                    demand[component_id] += batches * need
+            return all(
+                float_compare(qty, stock.get(component_id, 0.0),
+                              precision_digits=6) <= 0
+                for component_id, qty in demand.items())
+
+        # Largest feasible multiple of the rounding, by bisection
+        rounding = self.uom_id.rounding
+        low, high = 0, int(float_round(
+            potential_qty / rounding, precision_digits=0,
+            rounding_method='DOWN'))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if is_feasible(middle * rounding):
+                low = middle
+            else:
+                high = middle - 1
+        return float_round(low * rounding, precision_rounding=rounding)
+
+    @api.multi
+    def _compute_potential_qties(self, component_needs, availability):
+        """ Compute the potential of the whole recordset in one pass
+
+        :param component_needs: {product_id: ((component_id, need), ...)}
+        :param availability: {component_id: qty}
+        :return: {product_id: potential_qty}
+        """
+        # Unit conversion of each BoM, computed once for all its products
+        conversions = {}
+        res = {}
+        for product in self:
+            needs = component_needs[product.id]
+            if not needs:
+                # The BoM has no line we can use
+                res[product.id] = 0.0
+                continue
+
+            # Find the lowest quantity we can make with the stock at hand
+            bom = product.bom_id
+            potential_qty = bom.product_qty * min(
+                availability[component_id] / need
+                for component_id, need in needs
+            )
+            if potential_qty <= 0.0:
+                res[product.id] = 0.0
+                continue
+
+            if bom.id not in conversions:
+                from_uom = bom.product_uom_id
+                to_uom = bom.product_tmpl_id.uom_id
+                # Check the units can be converted
+                from_uom._compute_quantity(1.0, to_uom, round=False)
+                conversions[bom.id] = (
+                    from_uom.factor, to_uom.factor, to_uom.rounding)
+            from_factor, to_factor, rounding = conversions[bom.id]
+
+            # We want to respect the rounding factor of the potential_qty
+            # Rounding down as we want to be pesimistic.
+            res[product.id] = float_round(
+                potential_qty / from_factor * to_factor,
+                precision_rounding=rounding,
+                rounding_method='DOWN',
+            )
+        return res
+
+    @api.model
+    def _get_potential_qty_terms(self):
+        """ The potential cannot be aggregated from quants and moves: compute
+        it for the products having a BoM only and hand it over as arrays.
+        """
+        terms = super(ProductProduct, self)._get_potential_qty_terms()
+        products = self.env['mrp.bom'].search([]).mapped(
+            'product_tmpl_id.product_variant_ids')
+        if not products:
+            return terms
+        res, _ = products._compute_available_quantities_dict()
+        potentials = {
+            product_id: values['potential_qty']
+            for product_id, values in res.items()
+            if values['potential_qty']
+        }
+        if potentials:
+            terms.append((
+                'SELECT UNNEST(%s::integer[]) AS product_id, '
+                'UNNEST(%s::numeric[]) AS quantity',
+                [list(potentials.keys()), list(potentials.values())],
+            ))
+        return terms
+
+    @api.model
+    def _get_bom_component_needs(self, bom_id, product_id):
+        """ Return the needed qty of each component to make one unit of the
+        product with the BoM, phantom sub-BoMs exploded.
+        Cached in the current transaction until a BoM or a BoM line changes.
+
+        :rtype: tuple of (component id, qty)
+        """
+        cr = self.env.cr
+        cache = cr.cache.get(BOM_NEEDS_CACHE)
+        if cache is None:
+            cache = cr.cache[BOM_NEEDS_CACHE] = {}
+            for event in ('commit', 'rollback'):
+                cr.after(event, self._invalidate_bom_needs_cache)
+        key = (self.env.uid, self.env.user.company_id.id, bom_id, product_id)
+        if key not in cache:
+            product = self.browse(product_id)
+            exploded_components = self.env['mrp.bom'].browse(
+                bom_id).explode(product, 1.0)[1]
+            needs = self._get_components_needs(exploded_components)
+            cache[key] = tuple(
+                (component.id, need) for component, need in needs.items())
+        return cache[key]
+
+    @api.model
+    def _invalidate_bom_needs_cache(self):
+        """ Called whenever a BoM or a BoM line changes """
+        self.env.cr.cache.pop(BOM_NEEDS_CACHE, None)
 
     @api.model
     def _get_components_needs(self, exploded_components):
@@ -145,6 +401,7 @@ class ProductProduct(models.Model):
         needs = Counter()
         for bom_component in exploded_components:
             component = bom_component[0].product_id
-            needs += Counter({component: bom_component[1]['qty']})
+            needs[component] += bom_component[1]['qty']
 
-        return needs
+        # Like Counter additions, drop the components not needed
+        return +needs
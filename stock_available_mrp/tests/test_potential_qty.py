@@ -465,3 +465,92 @@ class TestPotentialQty(TransactionCase):
             {p1.id: 3.0, p2.id: 3.0, p3.id: 0.0},
             {p.id: p.potential_qty for p in products}
         )
+
+    def test_search_immediately_usable_qty(self):
+        p1 = self.product_model.create({'name': 'Test P1'})
+        p2 = self.product_model.create({'name': 'Test P2', 'type': 'product'})
+        self.create_simple_bom(p1, p2, sub_product_qty=2)
+        self.create_inventory(p2.id, 4)
+
+        products = self.product_model.search([
+            ('id', 'in', [p1.id, p2.id]),
+            ('immediately_usable_qty', '=', 2),
+        ])
+        self.assertEqual(products, p1)
+        templates = self.env['product.template'].search([
+            ('id', 'in', [p1.product_tmpl_id.id, p2.product_tmpl_id.id]),
+            ('immediately_usable_qty', '>', 2),
+        ])
+        self.assertEqual(templates, p2.product_tmpl_id)
+
+    def test_potential_qty_bom_change(self):
+        # The component needs are cached until the BoM changes
+        p1 = self.product_model.create({'name': 'Test P1'})
+        p2 = self.product_model.create({'name': 'Test P2', 'type': 'product'})
+        bom = self.create_simple_bom(p1, p2)
+        self.create_inventory(p2.id, 4)
+        p1.refresh()
+        self.assertEqual(p1.potential_qty, 4.0)
+
+        bom.bom_line_ids.product_qty = 2
+        p1.refresh()
+        self.assertEqual(p1.potential_qty, 2.0)
+
+        bom.product_qty = 2
+        p1.refresh()
+        self.assertEqual(p1.potential_qty, 4.0)
+
+    def test_potential_qty_shared_sub_assembly(self):
+        # The kit uses the same buildable sub-assembly on two lines
+        kit = self.product_model.create({'name': 'Test kit'})
+        sub = self.product_model.create({'name': 'Test sub-assembly'})
+        other = self.product_model.create({'name': 'Test other kit'})
+        component = self.product_model.create({
+            'name': 'Test component',
+            'type': 'product',
+        })
+        bom = self.create_simple_bom(kit, sub)
+        self.bom_line_model.create({
+            'bom_id': bom.id,
+            'product_id': sub.id,
+            'product_qty': 1,
+        })
+        self.create_simple_bom(sub, component)
+        self.create_simple_bom(other, sub)
+        self.create_inventory(component.id, 4)
+        self.config.set_param('stock_available_mrp_based_on',
+                              'immediately_usable_qty')
+        self.product_model.invalidate_cache()
+
+        products = kit | sub | other | component
+        self.assertEqual(
+            {kit.id: 2.0, sub.id: 4.0, other.id: 4.0, component.id: 0.0},
+            {p.id: p.potential_qty for p in products}
+        )
+
+    def test_potential_qty_diamond(self):
+        # The kit uses a component both directly and through a buildable
+        # sub-assembly: its stock can only be used once
+        kit = self.product_model.create({'name': 'Test kit'})
+        sub = self.product_model.create({'name': 'Test sub-assembly'})
+        component = self.product_model.create({
+            'name': 'Test component',
+            'type': 'product',
+        })
+        bom = self.create_simple_bom(kit, sub)
+        self.bom_line_model.create({
+            'bom_id': bom.id,
+            'product_id': component.id,
+            'product_qty': 1,
+        })
+        self.create_simple_bom(sub, component)
+        self.create_inventory(component.id, 4)
+        self.config.set_param('stock_available_mrp_based_on',
+                              'immediately_usable_qty')
+        self.product_model.invalidate_cache()
+
+        products = kit | sub | component
+        self.assertEqual(
+            {kit.id: 2.0, sub.id: 4.0, component.id: 0.0},
+            {p.id: p.potential_qty for p in products}
+        )
@@ -36,14 +36,11 @@ class ProductTemplate(models.Model):
     @api.multi
     def action_open_quants_unreserved(self):
         products_ids = self.mapped('product_variant_ids').ids
-        quants = self.env['stock.quant'].search([
-            ('product_id', 'in', products_ids),
-        ])
-        quant_ids = quants.filtered(
-            lambda x: x.product_id.qty_available_not_res > 0
-        ).ids
         result = self.env.ref('stock.product_open_quants').read()[0]
-        result['domain'] = [('id', 'in', quant_ids)]
+        result['domain'] = [
+            ('product_id', 'in', products_ids),
+            ('unreserved_quantity', '>', 0),
+        ]
         result['context'] = {
             'search_default_locationgroup': 1,
             'search_default_internal_loc': 1,
@@ -51,9 +48,16 @@ class ProductTemplate(models.Model):
         return result
 
     def _search_quantity_unreserved(self, operator, value):
-        domain = [('qty_available_not_res', operator, value)]
-        product_variant_ids = self.env['product.product'].search(domain)
-        return [('product_variant_ids', 'in', product_variant_ids.ids)]
+        # Find the templates having a variant matching, in SQL
+        domain = self.env['product.product']._search_quantity_unreserved(
+            operator, value)
+        dummy, variant_operator, (variant_query, params) = domain[0]
+        query = """
+            SELECT product_tmpl_id FROM product_product
+            WHERE active AND id %s (%s)
+        """ % (variant_operator == 'inselect' and 'IN' or 'NOT IN',
+               variant_query)
+        return [('id', 'inselect', (query, params))]
 
 
 class ProductProduct(models.Model):
@@ -68,9 +72,11 @@ class ProductProduct(models.Model):
 
     @api.multi
     def _prepare_domain_available_not_reserved(self):
-        domain_quant = [
-            ('product_id', 'in', self.ids),
-        ]
+        """ Domain of the quants counted as unreserved stock. On an empty
+        recordset, it covers the quants of all the products (search). """
+        domain_quant = []
+        if self:
+            domain_quant.append(('product_id', 'in', self.ids))
         domain_quant_locations = self._get_domain_locations()[0]
         domain_quant.extend(domain_quant_locations)
         return domain_quant
@@ -79,27 +85,33 @@ class ProductProduct(models.Model):
     def _compute_product_available_not_res_dict(self):
 
         res = {}
+        if not self:
+            return res
 
         domain_quant = self._prepare_domain_available_not_reserved()
-        quants = self.env['stock.quant'].with_context(lang=False).read_group(
-            domain_quant,
-            ['product_id', 'location_id', 'quantity', 'reserved_quantity'],
-            ['product_id', 'location_id'],
-            lazy=False)
-        product_sums = {}
-        for quant in quants:
-            # create a dictionary with the total value per products
-            product_sums.setdefault(quant['product_id'][0], 0.)
-            product_sums[quant['product_id'][0]] += (
-                quant['quantity'] - quant['reserved_quantity']
-            )
-        for product in self.with_context(prefetch_fields=False, lang=''):
-            available_not_res = float_round(
-                product_sums.get(product.id, 0.0),
-                precision_rounding=product.uom_id.rounding
-            )
+        quant_model = self.env['stock.quant']
+        query = quant_model._where_calc(domain_quant)
+        quant_model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, params = query.get_sql()
+        # Sum per product only, with the rounding of its unit of measure
+        self.env.cr.execute("""
+            SELECT stock_quant.product_id,
+                   SUM(stock_quant.quantity - stock_quant.reserved_quantity),
+                   uom.rounding
+            FROM %s, product_product pp, product_template pt, uom_uom uom
+            WHERE pp.id = stock_quant.product_id
+                AND pt.id = pp.product_tmpl_id
+                AND uom.id = pt.uom_id
+                AND %s
+            GROUP BY stock_quant.product_id, uom.rounding
+        """ % (from_clause, where_clause or 'TRUE'), params)
+        product_sums = {
+            product_id: float_round(qty, precision_rounding=rounding)
+            for product_id, qty, rounding in self.env.cr.fetchall()
+        }
+        for product in self:
             res[product.id] = {
-                'qty_available_not_res': available_not_res,
+                'qty_available_not_res': product_sums.get(product.id, 0.0),
             }
         return res
 
@@ -112,14 +124,47 @@ class ProductProduct(models.Model):
             prod.qty_available_not_res = qty
         return res
 
+    @api.model
+    def _get_quantity_unreserved_query(self, operator, value, negate=False):
+        """ Return the query of the products having quants in the locations
+        of the context whose unreserved quantity satisfies the condition.
+        :return: tuple (query, params)
+        """
+        domain_quant = self.browse()._prepare_domain_available_not_reserved()
+        quant_model = self.env['stock.quant']
+        query = quant_model._where_calc(domain_quant)
+        quant_model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, params = query.get_sql()
+        # Fully reserved quants do not change the sums: leaving them out
+        # lets the partial index on stock_quant be used
+        query = """
+            SELECT stock_quant.product_id
+            FROM %s, product_product pp, product_template pt, uom_uom uom
+            WHERE stock_quant.quantity != stock_quant.reserved_quantity
+                AND pp.id = stock_quant.product_id
+                AND pt.id = pp.product_tmpl_id
+                AND uom.id = pt.uom_id
+                AND %s
+            GROUP BY stock_quant.product_id, uom.rounding
+            HAVING %s(
+                ROUND(SUM(stock_quant.quantity -
+                          stock_quant.reserved_quantity)::numeric
+                      / uom.rounding::numeric) * uom.rounding::numeric
+                %s %%s)
+        """ % (from_clause, where_clause or 'TRUE',
+               negate and 'NOT ' or '', operator)
+        return query, params + [value]
+
     def _search_quantity_unreserved(self, operator, value):
         if operator not in OPERATORS:
             raise UserError(_('Invalid domain operator %s') % operator)
         if not isinstance(value, (float, int)):
             raise UserError(_('Invalid domain right operand %s') % value)
 
-        ids = []
-        for product in self.search([]):
-            if OPERATORS[operator](product.qty_available_not_res, value):
-                ids.append(product.id)
-        return [('id', 'in', ids)]
+        if OPERATORS[operator](0.0, value):
+            # Products without quants match too: exclude the others
+            query, params = self._get_quantity_unreserved_query(
+                operator, value, negate=True)
+            return [('id', 'not inselect', (query, params))]
+        query, params = self._get_quantity_unreserved_query(operator, value)
+        return [('id', 'inselect', (query, params))]
@@ -1,7 +1,11 @@
 # Copyright 2018 Camptocamp SA
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
-from odoo import api, fields, models
+from odoo import api, fields, models, _
+from odoo.addons import decimal_precision as dp
+from odoo.addons.stock.models.product import OPERATORS
+from odoo.exceptions import UserError
+from odoo.tools.sql import index_exists
 
 
 class StockQuant(models.Model):
@@ -12,6 +16,22 @@ class StockQuant(models.Model):
         compute="_compute_contains_unreserved",
         store=True,
     )
+    unreserved_quantity = fields.Float(
+        string="Unreserved Quantity",
+        digits=dp.get_precision('Product Unit of Measure'),
+        compute="_compute_unreserved_quantity",
+        search="_search_unreserved_quantity",
+    )
+
+    @api.model_cr
+    def init(self):
+        # Supports the search on the unreserved quantity of the products
+        index_name = 'stock_quant_unreserved_product_location_index'
+        if not index_exists(self._cr, index_name):
+            self._cr.execute("""
+                CREATE INDEX %s ON stock_quant (product_id, location_id)
+                WHERE quantity != reserved_quantity
+            """ % index_name)
 
     @api.depends('product_id', 'location_id', 'quantity', 'reserved_quantity')
     def _compute_contains_unreserved(self):
@@ -21,3 +41,23 @@ class StockQuant(models.Model):
                 record.location_id,
             )
             record.contains_unreserved = True if available > 0 else False
+
+    @api.depends('quantity', 'reserved_quantity')
+    def _compute_unreserved_quantity(self):
+        for record in self:
+            record.unreserved_quantity = (
+                record.quantity - record.reserved_quantity)
+
+    def _search_unreserved_quantity(self, operator, value):
+        if operator not in OPERATORS:
+            raise UserError(_('Invalid domain operator %s') % operator)
+        if not isinstance(value, (float, int)):
+            raise UserError(_('Invalid domain right operand %s') % value)
+        query = """
+            SELECT id FROM stock_quant
+            WHERE quantity - reserved_quantity %s %%s
+        """ % operator
+        if not OPERATORS[operator](0.0, value):
+            # Lets the partial index be used
+            query += " AND quantity != reserved_quantity"
+        return [('id', 'inselect', (query, [value]))]
@@ -6,6 +6,8 @@
 # Copyright 2019 JARSA Sistemas S.A. de C.V.
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
+from unittest import mock
+
 from odoo.tests.common import SavepointCase
 
 
@@ -159,7 +161,12 @@ class TestStockLogisticsWarehouse(SavepointCase):
         self.compare_qty_available_not_res(self.productB, 1)
         self.compare_qty_available_not_res(self.templateAB, 3)
 
-        self.templateAB.action_open_quants_unreserved()
+        action = self.templateAB.action_open_quants_unreserved()
+        quants = self.env['stock.quant'].search(action['domain'])
+        self.assertEqual(
+            quants.mapped('product_id'), self.productA | self.productB)
+        for quant in quants:
+            self.assertGreater(quant.unreserved_quantity, 0)
 
     def test_more_than_one_quant(self):
         self.env['stock.quant'].create(
@@ -179,6 +186,29 @@ class TestStockLogisticsWarehouse(SavepointCase):
              'quantity': 60.0})
         self.compare_qty_available_not_res(self.productA, 80)
 
+    def test_stock_search_domain_hook(self):
+        for location, qty in ((self.bin_a, 10.0), (self.bin_b, 60.0)):
+            self.env['stock.quant'].create(
+                {'location_id': location.id,
+                 'company_id': self.main_company.id,
+                 'product_id': self.productA.id,
+                 'quantity': qty})
+        self.check_variants_found_correctly('=', 70, self.productA)
+        product_class = type(self.productObj)
+        prepare_domain = product_class._prepare_domain_available_not_reserved
+
+        def prepare_domain_bin_a(products):
+            return prepare_domain(products) + [
+                ('location_id', '=', self.bin_a.id)]
+
+        # The search goes through the same domain hook as the compute
+        with mock.patch.object(
+                product_class, '_prepare_domain_available_not_reserved',
+                prepare_domain_bin_a):
+            self.check_variants_found_correctly('=', 10, self.productA)
+            self.check_variants_found_correctly(
+                '>', 10, self.env['product.product'])
+
     def check_variants_found_correctly(self, operator, value, expected):
         domain = [('id', 'in', self.templateAB.product_variant_ids.ids)]
         return self.check_found_correctly(self.env['product.product'],
@@ -0,0 +1,22 @@
+# Copyright 2017 Eficent Business and IT Consulting Services S.L.
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
+
+
+def migrate(cr, version):
+    if not version:
+        return
+
+    # The scheduled action is not updated, being noupdate: plan each
+    # warehouse in its own transaction unless its code was customized
+    cr.execute("""
+        UPDATE ir_act_server
+        SET code = 'model.cron_cycle_count(use_new_cursor=True)'
+        WHERE id IN (
+            SELECT c.ir_actions_server_id
+            FROM ir_cron c
+            JOIN ir_model_data d
+                ON d.model = 'ir.cron' AND d.res_id = c.id
+            WHERE d.module = 'stock_cycle_count'
+                AND d.name = 'ir_cron_compute_cycle_count_action'
+        ) AND TRIM(code) = 'model.cron_cycle_count()'
+    """)
@@ -4,8 +4,11 @@
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
+from collections import defaultdict
 from datetime import timedelta, datetime
 
+ROLLING_COUNTER_CACHE = 'stock_cycle_count_rolling_turnover'
+
 
 class StockCycleCountRule(models.Model):
     _name = 'stock.cycle.count.rule'
@@ -83,10 +86,8 @@ class StockCycleCountRule(models.Model):
     @api.onchange('location_ids')
     def _onchange_locaton_ids(self):
         """Get the warehouses for the selected locations."""
-        wh_ids = []
-        for loc in self.location_ids:
-            wh_ids.append(loc.get_warehouse().id)
-        wh_ids = list(set(wh_ids))
+        warehouses = self.location_ids._get_location_warehouses()
+        wh_ids = list(set(wh.id for wh in warehouses.values() if wh))
         self.warehouse_ids = self.env['stock.warehouse'].browse(wh_ids)
 
     name = fields.Char(required=True)
@@ -98,6 +99,12 @@ class StockCycleCountRule(models.Model):
         string='Rule Description', compute='_compute_rule_description',
     )
     active = fields.Boolean(default=True)
+    sequence = fields.Integer(
+        default=10,
+        help='Urgency of the counts proposed by this rule. When the daily '
+             'capacity of a warehouse is reached, the counts of the rules '
+             'with the lowest sequence are planned first.',
+    )
     periodic_qty_per_period = fields.Integer(
         string='Counts per period', default=1,
     )
@@ -105,6 +112,12 @@ class StockCycleCountRule(models.Model):
     turnover_inventory_value_threshold = fields.Float(
         string='Turnover Inventory Value Threshold',
     )
+    turnover_rolling_counter = fields.Boolean(
+        string='Use Rolling Turnover Counter',
+        help='Read the turnover of the locations from a counter increased '
+             'every time a move is done, instead of adding up their moves '
+             'at every planning.',
+    )
     currency_id = fields.Many2one(
         comodel_name='res.currency', string='Currency',
         compute='_compute_currency_id',
@@ -129,6 +142,55 @@ class StockCycleCountRule(models.Model):
         column2='location_id', string='Zones where applied',
     )
 
+    @api.model
+    def _use_rolling_turnover_counter(self):
+        """ Return whether a rule reads the rolling turnover counters of
+        the locations, cached in the current transaction """
+        cr = self.env.cr
+        if ROLLING_COUNTER_CACHE not in cr.cache:
+            cr.cache[ROLLING_COUNTER_CACHE] = bool(self.sudo().search_count([
+                ('rule_type', '=', 'turnover'),
+                ('turnover_rolling_counter', '=', True)]))
+            for event in ('commit', 'rollback'):
+                cr.after(event, self._invalidate_rolling_turnover_counter)
+        return cr.cache[ROLLING_COUNTER_CACHE]
+
+    @api.model
+    def _invalidate_rolling_turnover_counter(self):
+        self.env.cr.cache.pop(ROLLING_COUNTER_CACHE, None)
+
+    @api.model
+    def _reset_rolling_turnover_counters(self):
+        """ The counters are not maintained while no rule uses them: start
+        them again from the next planning """
+        self._invalidate_rolling_turnover_counter()
+        self.env.cr.execute("""
+            UPDATE stock_location SET cycle_count_turnover_date = NULL
+            WHERE cycle_count_turnover_date IS NOT NULL
+        """)
+        self.env['stock.location'].invalidate_cache(
+            ['cycle_count_turnover_date'])
+
+    @api.model
+    def create(self, vals):
+        res = super(StockCycleCountRule, self).create(vals)
+        if res.rule_type == 'turnover':
+            self._reset_rolling_turnover_counters()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockCycleCountRule, self).write(vals)
+        if {'rule_type', 'turnover_rolling_counter', 'active'} & set(vals):
+            self._reset_rolling_turnover_counters()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(StockCycleCountRule, self).unlink()
+        self._reset_rolling_turnover_counters()
+        return res
+
     def compute_rule(self, locs):
         if self.rule_type == 'periodic':
             proposed_cycle_counts = self._compute_rule_periodic(locs)
@@ -147,14 +209,35 @@ class StockCycleCountRule(models.Model):
         }
         return cycle_count
 
+    @api.model
+    def _get_latest_inventory_dates(self, locs):
+        """ Return the date of the latest inventory of each location, from a
+        single query.
+        :return: dict {location_id: date}
+        """
+        if not locs:
+            return {}
+        inventory_model = self.env['stock.inventory']
+        query = inventory_model._where_calc([
+            ('location_id', 'in', locs.ids),
+            ('state', 'in', ['confirm', 'done', 'draft'])])
+        inventory_model._apply_ir_rules(query, 'read')
+        from_clause, where_clause, params = query.get_sql()
+        self.env.cr.execute("""
+            SELECT DISTINCT ON (stock_inventory.location_id)
+                stock_inventory.location_id, stock_inventory.date
+            FROM %s WHERE %s
+            ORDER BY stock_inventory.location_id,
+                stock_inventory.date DESC NULLS LAST
+        """ % (from_clause, where_clause), params)
+        return dict(self.env.cr.fetchall())
+
     @api.model
     def _compute_rule_periodic(self, locs):
         cycle_counts = []
+        latest_inventory_dates = self._get_latest_inventory_dates(locs)
         for loc in locs:
-            latest_inventory_date = self.env['stock.inventory'].search([
-                ('location_id', '=', loc.id),
-                ('state', 'in', ['confirm', 'done', 'draft'])],
-                order="date desc", limit=1).date
+            latest_inventory_date = latest_inventory_dates.get(loc.id)
             if latest_inventory_date:
                 try:
                     period = self.periodic_count_period / \
@@ -173,47 +256,64 @@ class StockCycleCountRule(models.Model):
             cycle_counts.append(cycle_count)
         return cycle_counts
 
-    @api.model
-    def _get_turnover_moves(self, location, date):
-        moves = self.env['stock.move'].search([
-            '|', ('location_id', '=', location.id),
-            ('location_dest_id', '=', location.id),
-            ('date', '>', date),
-            ('state', '=', 'done')])
-        return moves
-
     @api.model
     def _compute_turnover(self, move):
         price = move._get_price_unit()
         turnover = move.product_uom_qty * price
         return turnover
 
+    @api.model
+    def _get_turnover_values(self, cutoff_dates):
+        """ Return the turnover of each location since its own cutoff date.
+        The done moves going into or out of the locations are selected in a
+        single query, then valued once each by `_compute_turnover`.
+        :param cutoff_dates: dict {location_id: date}
+        :return: dict {location_id: turnover} of the locations with moves
+        """
+        if not cutoff_dates:
+            return {}
+        location_ids = list(cutoff_dates)
+        self.env.cr.execute("""
+            WITH cutoff AS (
+                SELECT UNNEST(%s::integer[]) AS location_id,
+                    UNNEST(%s::timestamp[]) AS date
+            )
+            SELECT cutoff.location_id, m.id
+            FROM cutoff JOIN stock_move m
+                ON m.location_id = cutoff.location_id
+            WHERE m.state = 'done' AND m.date > cutoff.date
+            UNION
+            SELECT cutoff.location_id, m.id
+            FROM cutoff JOIN stock_move m
+                ON m.location_dest_id = cutoff.location_id
+            WHERE m.state = 'done' AND m.date > cutoff.date
+        """, (location_ids, [cutoff_dates[loc_id] for loc_id in location_ids]))
+        rows = self.env.cr.fetchall()
+        moves = self.env['stock.move'].browse(
+            list({move_id for dummy, move_id in rows}))
+        move_turnovers = {
+            move.id: self._compute_turnover(move) for move in moves}
+        turnovers = defaultdict(float)
+        for location_id, move_id in rows:
+            turnovers[location_id] += move_turnovers[move_id]
+        return dict(turnovers)
+
     @api.model
     def _compute_rule_turnover(self, locs):
         cycle_counts = []
+        latest_inventory_dates = self._get_latest_inventory_dates(locs)
+        if self.turnover_rolling_counter:
+            turnovers = locs._get_cycle_count_turnover(latest_inventory_dates)
+        else:
+            turnovers = self._get_turnover_values(latest_inventory_dates)
         for loc in locs:
-            last_inventories = self.env['stock.inventory'].search([
-                ('location_id', '=', loc.id),
-                ('state', 'in', ['confirm', 'done', 'draft'])]).mapped('date')
-            if last_inventories:
-                latest_inventory = sorted(last_inventories, reverse=True)[0]
-                moves = self._get_turnover_moves(loc, latest_inventory)
-                if moves:
-                    total_turnover = 0.0
-                    for m in moves:
-                        turnover = self._compute_turnover(m)
-                        total_turnover += turnover
-                    try:
-                        if total_turnover > \
-                                self.turnover_inventory_value_threshold:
-                            next_date = datetime.today()
-                            cycle_count = self._propose_cycle_count(next_date,
-                                                                    loc)
-                            cycle_counts.append(cycle_count)
-                    except Exception as e:
-                        raise UserError(_(
-                            'Error found when comparing turnover with the '
-                            'rule threshold. %s') % str(e))
+            latest_inventory = latest_inventory_dates.get(loc.id)
+            if latest_inventory:
+                if loc.id in turnovers and turnovers[loc.id] > \
+                        self.turnover_inventory_value_threshold:
+                    next_date = datetime.today()
+                    cycle_count = self._propose_cycle_count(next_date, loc)
+                    cycle_counts.append(cycle_count)
             else:
                 next_date = datetime.today()
                 cycle_count = self._propose_cycle_count(next_date, loc)
@@ -224,9 +324,11 @@ class StockCycleCountRule(models.Model):
     def _compute_rule_accuracy(self, locs):
         self.ensure_one()
         cycle_counts = []
-        for loc in locs:
-            if loc.loc_accuracy < self.accuracy_threshold:
-                next_date = datetime.today()
-                cycle_count = self._propose_cycle_count(next_date, loc)
-                cycle_counts.append(cycle_count)
+        inaccurate_locs = self.env['stock.location'].search([
+            ('id', 'in', locs.ids),
+            ('loc_accuracy', '<', self.accuracy_threshold)])
+        for loc in inaccurate_locs:
+            next_date = datetime.today()
+            cycle_count = self._propose_cycle_count(next_date, loc)
+            cycle_counts.append(cycle_count)
         return cycle_counts
@@ -4,6 +4,7 @@
 
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools.sql import create_index
 
 PERCENT = 100.0
 
@@ -11,19 +12,45 @@ PERCENT = 100.0
 class StockInventory(models.Model):
     _inherit = 'stock.inventory'
 
+    @api.multi
+    def _get_inventory_accuracy_totals(self):
+        """ Return the total of the absolute theoretical quantities and of
+        the absolute discrepancies of the lines of each inventory, summed
+        in a single query.
+        :return: dict {inventory_id: (theoretical, discrepancy, line count)}
+        """
+        if not self.ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT inventory_id,
+                SUM(ABS(theoretical_qty)),
+                SUM(ABS(product_qty - theoretical_qty)),
+                COUNT(id)
+            FROM stock_inventory_line
+            WHERE inventory_id IN %s
+            GROUP BY inventory_id
+        """, (tuple(self.ids),))
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
+
     @api.multi
     @api.depends("state", "line_ids")
     def _compute_inventory_accuracy(self):
+        totals = self.filtered('id')._get_inventory_accuracy_totals()
         for inv in self:
-            theoretical = sum(inv.line_ids.mapped(
-                lambda x: abs(x.theoretical_qty)))
-            abs_discrepancy = sum(inv.line_ids.mapped(
-                lambda x: abs(x.discrepancy_qty)))
+            if inv.id:
+                theoretical, abs_discrepancy, line_count = totals.get(
+                    inv.id, (0.0, 0.0, 0))
+            else:
+                theoretical = sum(inv.line_ids.mapped(
+                    lambda x: abs(x.theoretical_qty)))
+                abs_discrepancy = sum(inv.line_ids.mapped(
+                    lambda x: abs(x.discrepancy_qty)))
+                line_count = len(inv.line_ids)
             if theoretical:
                 inv.inventory_accuracy = max(
                     PERCENT * (theoretical - abs_discrepancy) / theoretical,
                     0.0)
-            if not inv.line_ids and inv.state == 'done':
+            if not line_count and inv.state == 'done':
                 inv.inventory_accuracy = PERCENT
 
     cycle_count_id = fields.Many2one(
@@ -33,10 +60,19 @@ class StockInventory(models.Model):
         string='Accuracy', compute='_compute_inventory_accuracy',
         digits=(3, 2), store=True, group_operator="avg")
 
+    @api.model_cr
+    def init(self):
+        # Supports the search of the latest inventory of the locations
+        create_index(
+            self._cr, 'stock_inventory_location_state_date_index',
+            self._table, ['location_id', 'state', 'date'])
+
     def _update_cycle_state(self):
         for inv in self:
             if inv.cycle_count_id and inv.state == 'done':
                 inv.cycle_count_id.state = 'done'
+        self.filtered(lambda i: i.state == 'done').mapped(
+            'location_id')._recompute_loc_accuracy()
         return True
 
     @api.multi
@@ -4,37 +4,56 @@
 
 import logging
 
-from odoo import api, fields, models, tools
+from odoo import api, fields, models
+from odoo.osv import expression
 from odoo.tools import DEFAULT_SERVER_DATETIME_FORMAT
 from datetime import datetime
 _logger = logging.getLogger(__name__)
 
-try:
-    from statistics import mean
-    STATS_PATH = tools.find_in_path('statistics')
-except (ImportError, IOError) as err:
-    _logger.debug(err)
-
 
 class StockLocation(models.Model):
     _inherit = 'stock.location'
 
     @api.multi
+    @api.depends()
     def _compute_loc_accuracy(self):
+        """ Average the accuracy of the latest done inventories of the
+        locations, as many as set in their warehouse, in a single query """
+        locations = self.filtered('id')
+        accuracies = {}
+        if locations:
+            warehouses = locations._get_location_warehouses()
+            self.env.cr.execute("""
+                WITH location AS (
+                    SELECT UNNEST(%s::integer[]) AS id,
+                        UNNEST(%s::integer[]) AS counts_qty
+                ), history AS (
+                    SELECT i.location_id, i.inventory_accuracy,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY i.location_id
+                            ORDER BY i.write_date DESC, i.id DESC) AS rank
+                    FROM stock_inventory i
+                    WHERE i.state = 'done' AND i.location_id IN %s
+                )
+                SELECT history.location_id, AVG(history.inventory_accuracy)
+                FROM history
+                JOIN location ON location.id = history.location_id
+                WHERE location.counts_qty <= 0
+                    OR history.rank <= location.counts_qty
+                GROUP BY history.location_id
+            """, (locations.ids,
+                  [warehouses[loc_id].counts_for_accuracy_qty or 0
+                   for loc_id in locations.ids],
+                  tuple(locations.ids)))
+            accuracies = dict(self.env.cr.fetchall())
         for rec in self:
-            history = self.env['stock.inventory'].search([
-                ('location_id', '=', rec.id), ('state', '=', 'done')])
-            history = history.sorted(key=lambda r: r.write_date, reverse=True)
-            if history:
-                wh = rec.get_warehouse()
-                if wh.counts_for_accuracy_qty and \
-                        len(history) > wh.counts_for_accuracy_qty:
-                    rec.loc_accuracy = mean(
-                        history[:wh.counts_for_accuracy_qty].mapped(
-                            'inventory_accuracy'))
-                else:
-                    rec.loc_accuracy = mean(
-                        history.mapped('inventory_accuracy'))
+            rec.loc_accuracy = accuracies.get(rec.id, 0.0)
+
+    @api.multi
+    def _recompute_loc_accuracy(self):
+        """ Update the stored accuracy of the locations in batch """
+        self.env.add_todo(self._fields['loc_accuracy'], self)
+        self.recompute()
 
     zero_confirmation_disabled = fields.Boolean(
         string='Disable Zero Confirmations',
@@ -51,9 +70,74 @@ class StockLocation(models.Model):
     )
     loc_accuracy = fields.Float(
         string='Inventory Accuracy', compute='_compute_loc_accuracy',
-        digits=(3, 2),
+        digits=(3, 2), store=True, index=True,
+    )
+    cycle_count_turnover = fields.Float(
+        string='Turnover Since Last Inventory', readonly=True, copy=False,
+        help='Rolling turnover counter used by the cycle count rules of '
+             'type value turnover, increased every time a move is done.',
+    )
+    cycle_count_turnover_date = fields.Datetime(
+        string='Turnover Counter Start', readonly=True, copy=False,
+        help='Date of the inventory the turnover counter is counting from. '
+             'The counter is not maintained while it is not set.',
     )
 
+    @api.multi
+    def _get_cycle_count_turnover(self, cutoff_dates):
+        """ Return the rolling turnover counters of the locations, starting
+        again from the moves done after their cutoff date the counters not
+        counting from it yet.
+        :param cutoff_dates: dict {location_id: date}
+        :return: dict {location_id: turnover}
+        """
+        locs = self.filtered(lambda l: cutoff_dates.get(l.id))
+        outdated = {
+            loc.id: cutoff_dates[loc.id] for loc in locs
+            if loc.cycle_count_turnover_date != cutoff_dates[loc.id]}
+        if outdated:
+            rule_model = self.env['stock.cycle.count.rule']
+            turnovers = rule_model._get_turnover_values(outdated)
+            location_ids = list(outdated)
+            self.env.cr.execute("""
+                UPDATE stock_location
+                SET cycle_count_turnover = counter.turnover,
+                    cycle_count_turnover_date = counter.date
+                FROM (
+                    SELECT UNNEST(%s::integer[]) AS id,
+                        UNNEST(%s::float8[]) AS turnover,
+                        UNNEST(%s::timestamp[]) AS date
+                ) AS counter
+                WHERE stock_location.id = counter.id
+            """, (location_ids,
+                  [turnovers.get(loc_id, 0.0) for loc_id in location_ids],
+                  [outdated[loc_id] for loc_id in location_ids]))
+            self.invalidate_cache(
+                ['cycle_count_turnover', 'cycle_count_turnover_date'],
+                location_ids)
+        return {loc.id: loc.cycle_count_turnover for loc in locs}
+
+    @api.multi
+    def _add_cycle_count_turnover(self, turnovers):
+        """ Increase the rolling turnover counters in use.
+        :param turnovers: dict {location_id: turnover}
+        """
+        if not turnovers:
+            return
+        location_ids = list(turnovers)
+        self.env.cr.execute("""
+            UPDATE stock_location
+            SET cycle_count_turnover =
+                COALESCE(cycle_count_turnover, 0.0) + counter.turnover
+            FROM (
+                SELECT UNNEST(%s::integer[]) AS id,
+                    UNNEST(%s::float8[]) AS turnover
+            ) AS counter
+            WHERE stock_location.id = counter.id
+                AND stock_location.cycle_count_turnover_date IS NOT NULL
+        """, (location_ids, [turnovers[loc_id] for loc_id in location_ids]))
+        self.invalidate_cache(['cycle_count_turnover'], location_ids)
+
     @api.multi
     def _get_zero_confirmation_domain(self):
         self.ensure_one()
@@ -63,43 +147,75 @@ class StockLocation(models.Model):
         ]
         return domain
 
+    @api.multi
+    def _get_zero_confirmation_batch_domain(self):
+        """ Domain of the stocked quants of all the locations at once, from
+        the domain of each location """
+        return expression.OR([
+            loc._get_zero_confirmation_domain() for loc in self])
+
     @api.multi
     def check_zero_confirmation(self):
-        for rec in self:
-            if not rec.zero_confirmation_disabled:
-                wh = rec.get_warehouse()
-                rule_model = self.env['stock.cycle.count.rule']
-                zero_rule = rule_model.search([
-                    ('rule_type', '=', 'zero'),
-                    ('warehouse_ids', '=', wh.id)])
-                if zero_rule:
-                    quants = self.env['stock.quant'].search(
-                        rec._get_zero_confirmation_domain())
-                    if not quants:
-                        rec.create_zero_confirmation_cycle_count()
+        """ Plan a zero-confirmation for the locations left empty, in batch """
+        locations = self.filtered(lambda l: not l.zero_confirmation_disabled)
+        if not locations:
+            return
+        warehouses = locations._get_location_warehouses()
+        zero_rules = {}
+        for rule in self.env['stock.cycle.count.rule'].search([
+                ('rule_type', '=', 'zero'),
+                ('warehouse_ids', 'in', [
+                    wh.id for wh in warehouses.values() if wh])]):
+            for wh in rule.warehouse_ids:
+                zero_rules[wh] = rule
+        locations = locations.filtered(
+            lambda l: warehouses[l.id] in zero_rules)
+        if not locations:
+            return
+        stocked = self.env['stock.quant'].read_group(
+            locations._get_zero_confirmation_batch_domain(),
+            ['location_id'], ['location_id'])
+        stocked_ids = {group['location_id'][0] for group in stocked}
+        empty_locations = locations.filtered(lambda l: l.id not in stocked_ids)
+        if empty_locations:
+            empty_locations._create_zero_confirmation_cycle_counts(
+                warehouses, zero_rules)
 
     @api.multi
-    def create_zero_confirmation_cycle_count(self):
-        self.ensure_one()
+    def _create_zero_confirmation_cycle_counts(self, warehouses, zero_rules):
+        """ Cancel the draft cycle counts of the locations inside the planning
+        horizon of their warehouse, and create their zero-confirmations.
+        :param warehouses: dict {location_id: warehouse}
+        :param zero_rules: dict {warehouse: zero confirmation rule}
+        """
+        cycle_count_model = self.env['stock.cycle.count']
         date = datetime.today().strftime(DEFAULT_SERVER_DATETIME_FORMAT)
-        wh_id = self.get_warehouse().id
-        date_horizon = self.get_warehouse().get_horizon_date().strftime(
-            DEFAULT_SERVER_DATETIME_FORMAT)
-        counts_planned = self.env['stock.cycle.count'].search([
-            ('date_deadline', '<', date_horizon), ('state', '=', 'draft'),
-            ('location_id', '=', self.id)])
-        if counts_planned:
-            counts_planned.write({'state': 'cancelled'})
-        rule = self.env['stock.cycle.count.rule'].search([
-            ('rule_type', '=', 'zero'), ('warehouse_ids', '=', wh_id)])
-        self.env['stock.cycle.count'].create({
+        horizons = {
+            wh: wh.get_horizon_date()
+            for wh in set(warehouses[loc.id] for loc in self)}
+        counts_planned = cycle_count_model.search([
+            ('state', '=', 'draft'), ('location_id', 'in', self.ids)])
+        counts_planned.filtered(
+            lambda cc: cc.date_deadline and fields.Datetime.to_datetime(
+                cc.date_deadline) < horizons[warehouses[cc.location_id.id]]
+        ).write({'state': 'cancelled'})
+        cycle_count_model.create([{
             'date_deadline': date,
-            'location_id': self.id,
-            'cycle_count_rule_id': rule.id,
+            'location_id': loc.id,
+            'cycle_count_rule_id': zero_rules[warehouses[loc.id]].id,
             'state': 'draft'
-        })
+        } for loc in self])
         return True
 
+    @api.multi
+    def create_zero_confirmation_cycle_count(self):
+        self.ensure_one()
+        wh = self._get_location_warehouses()[self.id]
+        rule = self.env['stock.cycle.count.rule'].search([
+            ('rule_type', '=', 'zero'), ('warehouse_ids', '=', wh.id)])
+        return self._create_zero_confirmation_cycle_counts(
+            {self.id: wh}, {wh: rule})
+
     @api.multi
     def action_accuracy_stats(self):
         self.ensure_one()
@@ -3,6 +3,8 @@
 # Copyright 2019 Tecnativa - Pedro M. Baeza
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
+from collections import defaultdict
+
 from odoo import api, models
 
 
@@ -13,4 +15,30 @@ class StockMove(models.Model):
     def _action_done(self):
         res = super()._action_done()
         self.mapped("location_id").check_zero_confirmation()
+        res._update_cycle_count_turnover()
         return res
+
+    @api.multi
+    def _update_cycle_count_turnover(self):
+        """ Add the turnover of the done moves to the rolling counters of
+        their locations, when a rule uses them."""
+        rule_model = self.env['stock.cycle.count.rule']
+        if not rule_model._use_rolling_turnover_counter():
+            return
+        moves = self.filtered(lambda m: m.state == 'done')
+        locations = (
+            moves.mapped('location_id') | moves.mapped('location_dest_id')
+        ).filtered('cycle_count_turnover_date')
+        if not locations:
+            return
+        turnovers = defaultdict(float)
+        for move in moves:
+            counted = [
+                loc for loc in move.location_id | move.location_dest_id
+                if loc in locations]
+            if not counted:
+                continue
+            turnover = rule_model._compute_turnover(move)
+            for loc in counted:
+                turnovers[loc.id] += turnover
+        locations._add_cycle_count_turnover(turnovers)
@@ -2,9 +2,12 @@
 #   (http://www.eficent.com)
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
-from odoo import api, fields, models
+from odoo import api, fields, models, registry
+from odoo.osv import expression
+from collections import defaultdict
 from datetime import datetime, timedelta
 import logging
+import time
 
 _logger = logging.getLogger(__name__)
 
@@ -27,6 +30,36 @@ class StockWarehouse(models.Model):
         default=1,
         help='Number of latest inventories used to calculate location '
              'accuracy')
+    cycle_count_daily_capacity = fields.Integer(
+        string='Daily Cycle Count Capacity',
+        help='Maximum workload of cycle counts to plan per day. The planner '
+             'moves the counts exceeding it to the next days of the planning '
+             'horizon, the most urgent ones first. Leave it to 0 for no '
+             'limit.')
+    cycle_count_capacity_unit = fields.Selection(
+        selection=[('location', 'Locations'),
+                   ('line', 'Estimated Lines')],
+        string='Daily Capacity Unit',
+        default='location',
+        help='Workload of a cycle count: one per location, or the number of '
+             'quants in the location as an estimate of the inventory lines '
+             'to count.')
+    cycle_count_jobs = fields.Integer(
+        string='Cycle Count Planning Jobs',
+        default=1,
+        help='Number of independent jobs the cycle count planner splits the '
+             'locations of this warehouse into. Each job runs and commits in '
+             'its own transaction. Warehouses with a daily capacity are '
+             'always planned by a single job.')
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockWarehouse, self).write(vals)
+        if 'counts_for_accuracy_qty' in vals:
+            self.env['stock.location'].search([
+                ('id', 'child_of', self.mapped('view_location_id').ids),
+            ])._recompute_loc_accuracy()
+        return res
 
     @api.multi
     def get_horizon_date(self):
@@ -43,17 +76,48 @@ class StockWarehouse(models.Model):
                   ('cycle_count_disabled', '=', False)]
         return domain
 
+    @api.multi
+    def _get_cycle_count_shard_domain(self, shard, shard_count):
+        """ Return the domain of the locations of one shard of the
+        warehouse. The subtrees below its view location are dealt out to the
+        shards, so that a subtree is planned by a single job. The view
+        location and the locations outside of the warehouse go to the first
+        shard.
+        """
+        self.ensure_one()
+        view = self.view_location_id
+        children = self.env['stock.location'].with_context(
+            active_test=False).search(
+                [('location_id', '=', view.id)], order='id')
+        domains = [
+            [('parent_path', '=like', child.parent_path + '%')]
+            for child in children[shard::shard_count]]
+        if shard == 0:
+            domains += [
+                [('id', '=', view.id)],
+                ['!', ('parent_path', '=like', view.parent_path + '%')],
+            ]
+        return expression.OR(domains)
+
     @api.model
     def _search_cycle_count_locations(self, rule):
+        location_shard = self.env.context.get('cycle_count_location_shard')
+        shard_domain = []
+        if location_shard:
+            shard_domain = self._get_cycle_count_shard_domain(
+                *location_shard)
         locations = self.env['stock.location']
         if rule.apply_in == 'warehouse':
-            locations = self.env['stock.location'].search(
+            locations = self.env['stock.location'].search(expression.AND([
                 self._get_cycle_count_locations_search_domain(
-                    self.view_location_id))
+                    self.view_location_id),
+                shard_domain]))
         elif rule.apply_in == 'location':
             for loc in rule.location_ids:
                 locations += self.env['stock.location'].search(
-                    self._get_cycle_count_locations_search_domain(loc))
+                    expression.AND([
+                        self._get_cycle_count_locations_search_domain(loc),
+                        shard_domain]))
         return locations
 
     @api.multi
@@ -73,6 +137,143 @@ class StockWarehouse(models.Model):
             'state': 'draft'
         }
 
+    @api.model
+    def _get_earliest_cycle_counts_proposed(self, proposed_cycle_counts):
+        """ Return the earliest proposed cycle count of each location """
+        earliest = {}
+        for proposed in proposed_cycle_counts:
+            current = earliest.get(proposed['location'])
+            if current is None or proposed['date'] < current['date']:
+                earliest[proposed['location']] = proposed
+        return earliest
+
+    @api.multi
+    def _get_cycle_count_weights(self, location_ids):
+        """ Return the workload of counting each location, in the capacity
+        unit of the warehouse, from a single grouped quant query """
+        self.ensure_one()
+        weights = defaultdict(lambda: 1)
+        if self.cycle_count_capacity_unit == 'line' and location_ids:
+            for group in self.env['stock.quant'].read_group(
+                    [('location_id', 'in', list(location_ids))],
+                    ['location_id'], ['location_id']):
+                weights[group['location_id'][0]] = max(
+                    group['location_id_count'], 1)
+        return weights
+
+    @api.multi
+    def _level_cycle_counts(self, candidates, load, weights):
+        """ Spread the cycle counts over the days so that the daily capacity
+        of the warehouse is not exceeded. The counts are planned in a single
+        pass, sorted by urgency: the earliest proposed date first, then the
+        rule sequence.
+        :param candidates: list of (location, proposed date, rule)
+        :param load: defaultdict {date: workload already planned}
+        :param weights: dict {location_id: workload}
+        :return: list of (location, planned date, rule)
+        """
+        self.ensure_one()
+        capacity = self.cycle_count_daily_capacity
+        if capacity <= 0:
+            return candidates
+        planned = []
+        day = fields.Date.context_today(self)
+        for loc, date, rule in sorted(
+                candidates, key=lambda c: (c[1], c[2].sequence, c[0].id)):
+            day = max(day, date)
+            weight = weights[loc.id]
+            while load[day] and load[day] + weight > capacity:
+                day += timedelta(days=1)
+            load[day] += weight
+            planned.append((loc, day, rule))
+        return planned
+
+    @api.multi
+    def _plan_cycle_counts(self, proposed_cycle_counts):
+        """ Create or update the planned cycle counts of the locations
+        with the proposed cycle counts, in batch, leveling them over the
+        planning horizon when the warehouse has a daily capacity """
+        self.ensure_one()
+        cycle_count_model = self.env['stock.cycle.count']
+        today = fields.Date.context_today(self)
+        earliest = self._get_earliest_cycle_counts_proposed(
+            proposed_cycle_counts)
+        existing_by_location = defaultdict(list)
+        for cycle_count in cycle_count_model.search([
+                ('location_id', 'in', [loc.id for loc in earliest]),
+                ('state', 'in', ['draft'])]):
+            existing_by_location[cycle_count.location_id.id].append(
+                cycle_count)
+        candidates = []
+        to_reschedule = {}
+        for loc, cycle_count_proposed in earliest.items():
+            cycle_count_proposed_date = fields.Date.from_string(
+                cycle_count_proposed['date'])
+            existing_cycle_counts = existing_by_location.get(loc.id)
+            if existing_cycle_counts:
+                existing_earliest_date = min(
+                    fields.Date.from_string(cc.date_deadline)
+                    for cc in existing_cycle_counts)
+                if cycle_count_proposed_date < existing_earliest_date:
+                    to_reschedule[loc.id] = (existing_earliest_date, [
+                        cc.id for cc in existing_cycle_counts
+                        if fields.Date.from_string(cc.date_deadline) ==
+                        existing_earliest_date])
+                    candidates.append((
+                        loc, cycle_count_proposed_date,
+                        cycle_count_proposed['rule_type']))
+                continue
+            delta = (fields.Datetime.from_string(
+                cycle_count_proposed['date']) - datetime.today())
+            if delta.days < self.cycle_count_planning_horizon:
+                candidates.append((
+                    loc, cycle_count_proposed_date,
+                    cycle_count_proposed['rule_type']))
+        load = defaultdict(int)
+        weights = {}
+        if self.cycle_count_daily_capacity > 0 and candidates:
+            date_horizon = today + timedelta(
+                days=self.cycle_count_planning_horizon)
+            planned_cycle_counts = cycle_count_model.search([
+                ('state', '=', 'draft'),
+                ('location_id', 'child_of', self.view_location_id.id),
+                ('date_deadline', '>=', today),
+                ('date_deadline', '<', date_horizon),
+                ('id', 'not in', [
+                    cc_id for dummy, cc_ids in to_reschedule.values()
+                    for cc_id in cc_ids])])
+            weights = self._get_cycle_count_weights(
+                set(planned_cycle_counts.mapped('location_id').ids) |
+                set(loc.id for loc, dummy, dummy in candidates))
+            for cc in planned_cycle_counts:
+                load[fields.Date.from_string(cc.date_deadline)] += \
+                    weights[cc.location_id.id]
+        to_update = defaultdict(list)
+        to_create = []
+        for loc, date, rule in self._level_cycle_counts(
+                candidates, load, weights):
+            if loc.id in to_reschedule:
+                existing_earliest_date, cc_ids = to_reschedule[loc.id]
+                if date < existing_earliest_date:
+                    to_update[(date, rule.id)].extend(cc_ids)
+                continue
+            if self.cycle_count_daily_capacity > 0 and date > today and \
+                    (date - today).days >= self.cycle_count_planning_horizon:
+                # Leveled out of the planning horizon
+                continue
+            to_create.append(self._prepare_cycle_count({
+                'date': date,
+                'location': loc,
+                'rule_type': rule,
+            }))
+        for (date_deadline, rule_id), cc_ids in to_update.items():
+            cycle_count_model.browse(cc_ids).write({
+                'date_deadline': date_deadline,
+                'cycle_count_rule_id': rule_id,
+            })
+        if to_create:
+            cycle_count_model.create(to_create)
+
     @api.multi
     def action_compute_cycle_count_rules(self):
         """ Apply the rule in all the sublocations of a given warehouse(s) and
@@ -86,50 +287,71 @@ class StockWarehouse(models.Model):
                 if locations:
                     proposed_cycle_counts.extend(rule.compute_rule(locations))
             if proposed_cycle_counts:
-                locations = list(set([d['location'] for d in
-                                      proposed_cycle_counts]))
-                for loc in locations:
-                    proposed_for_loc = list(filter(
-                        lambda x: x['location'] == loc, proposed_cycle_counts))
-                    earliest_date = min([d['date'] for d in proposed_for_loc])
-                    cycle_count_proposed = list(filter(
-                        lambda x: x['date'] == earliest_date,
-                        proposed_for_loc))[0]
-                    domain = [('location_id', '=', loc.id),
-                              ('state', 'in', ['draft'])]
-                    existing_cycle_counts = self.env[
-                        'stock.cycle.count'].search(domain)
-                    if existing_cycle_counts:
-                        existing_earliest_date = sorted(
-                            existing_cycle_counts.mapped('date_deadline'))[0]
-                        existing_earliest_date = fields.Date.from_string(
-                            existing_earliest_date)
-                        cycle_count_proposed_date = fields.Date.from_string(
-                            cycle_count_proposed['date'])
-                        if (cycle_count_proposed_date <
-                                existing_earliest_date):
-                            cc_to_update = existing_cycle_counts.search([
-                                ('date_deadline', '=', existing_earliest_date)
-                            ])
-                            cc_to_update.write({
-                                'date_deadline': cycle_count_proposed_date,
-                                'cycle_count_rule_id': cycle_count_proposed[
-                                    'rule_type'].id,
-                            })
-                    delta = (fields.Datetime.from_string(
-                        cycle_count_proposed['date']) - datetime.today())
-                    if not existing_cycle_counts and \
-                            delta.days < rec.cycle_count_planning_horizon:
-                        cc_vals = self._prepare_cycle_count(
-                            cycle_count_proposed)
-                        self.env['stock.cycle.count'].create(cc_vals)
+                rec._plan_cycle_counts(proposed_cycle_counts)
+
+    @api.model
+    def _get_cycle_count_jobs(self, shard=0, shard_count=1):
+        """ Return the cycle count planning jobs of the given shard, as
+        (warehouse, location shard) pairs. The locations of a warehouse are
+        split into as many jobs as set in it, and the jobs of all the
+        warehouses are dealt out to the shards. A warehouse with a daily
+        capacity is planned by a single job, leveling all its counts at once.
+        """
+        jobs = []
+        for wh in self.search([]):
+            job_count = max(wh.cycle_count_jobs, 1)
+            if wh.cycle_count_daily_capacity > 0:
+                job_count = 1
+            for job in range(job_count):
+                jobs.append((wh, (job, job_count) if job_count > 1 else None))
+        return jobs[shard::shard_count]
+
+    @api.multi
+    def _run_cycle_count_job(self, location_shard=None,
+                             use_new_cursor=False):
+        """ Plan the cycle counts of a warehouse, or of one shard of its
+        locations. With a new cursor, the job is committed on its own and a
+        failure only rolls back this job.
+        """
+        self.ensure_one()
+        start = time.time()
+        job_name = self.name
+        if location_shard:
+            job_name += ' (%s/%s)' % (location_shard[0] + 1,
+                                      location_shard[1])
+        if not use_new_cursor:
+            self.with_context(
+                cycle_count_location_shard=location_shard,
+            ).action_compute_cycle_count_rules()
+        else:
+            new_cr = registry(self._cr.dbname).cursor()
+            try:
+                self.with_env(self.env(cr=new_cr)).with_context(
+                    cycle_count_location_shard=location_shard,
+                ).action_compute_cycle_count_rules()
+                new_cr.commit()
+            except Exception:
+                new_cr.rollback()
+                _logger.exception(
+                    "Error while planning the cycle counts of %s.", job_name)
+                return False
+            finally:
+                new_cr.close()
+        _logger.info("Cycle counts of %s planned in %.2fs.",
+                     job_name, time.time() - start)
+        return True
 
     @api.model
-    def cron_cycle_count(self):
+    def cron_cycle_count(self, use_new_cursor=False, shard=0, shard_count=1):
+        """ Plan the cycle counts of all the warehouses. The planning can be
+        spread over several scheduled actions, each one running the jobs of
+        its shard in parallel with the others.
+        """
         _logger.info("stock_cycle_count cron job started.")
         try:
-            whs = self.search([])
-            whs.action_compute_cycle_count_rules()
+            for wh, location_shard in self._get_cycle_count_jobs(
+                    shard, shard_count):
+                wh._run_cycle_count_job(location_shard, use_new_cursor)
         except Exception as e:
             _logger.info(
                 "Error while running stock_cycle_count cron job: %s", str(e))
@@ -2,37 +2,77 @@
 #   (http://www.eficent.com)
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
+from collections import namedtuple
+
 from odoo import api, models
 
+AccuracyRow = namedtuple(
+    'AccuracyRow', ['name', 'date', 'accuracy', 'theoretical_qty',
+                    'discrepancy_qty'])
+
 
 class LocationAccuracyReport(models.AbstractModel):
-    _name = "report.stock_location_accuracy"
+    _name = "report.stock_cycle_count.stock_location_accuracy"
     _description = "Location Accuracy Report"
 
+    _location_chunk_size = 1000
+
     @api.model
-    def _get_inventory_domain(self, loc_id, exclude_sublocation=True):
-        return [('location_id', '=', loc_id),
+    def _get_inventory_domain(self, loc_ids, exclude_sublocation=True):
+        return [('location_id', 'in', loc_ids),
                 ('exclude_sublocation', '=', exclude_sublocation),
                 ('state', '=', 'done')]
 
+    @api.model
+    def _iter_location_data(self, locations):
+        """ Yield the accuracy history of the locations, as compact rows
+        sorted by date, fetching the locations in chunks with one grouped
+        query each, so that the report only holds one chunk at a time.
+        :return: iterator of (location, [AccuracyRow])
+        """
+        inventory_model = self.env["stock.inventory"]
+        for index in range(0, len(locations), self._location_chunk_size):
+            chunk = locations[index:index + self._location_chunk_size]
+            query = inventory_model._where_calc(
+                self._get_inventory_domain(chunk.ids))
+            inventory_model._apply_ir_rules(query, 'read')
+            from_clause, where_clause, params = query.get_sql()
+            self.env.cr.execute("""
+                WITH inventory AS (
+                    SELECT stock_inventory.id, stock_inventory.location_id,
+                        stock_inventory.name, stock_inventory.date,
+                        stock_inventory.inventory_accuracy
+                    FROM %s WHERE %s
+                )
+                SELECT inventory.location_id, inventory.name, inventory.date,
+                    inventory.inventory_accuracy,
+                    COALESCE(SUM(ABS(line.theoretical_qty)), 0.0),
+                    COALESCE(SUM(ABS(
+                        line.product_qty - line.theoretical_qty)), 0.0)
+                FROM inventory
+                LEFT JOIN stock_inventory_line line
+                    ON line.inventory_id = inventory.id
+                GROUP BY inventory.id, inventory.location_id, inventory.name,
+                    inventory.date, inventory.inventory_accuracy
+                ORDER BY inventory.location_id, inventory.date, inventory.id
+            """ % (from_clause, where_clause), params)
+            rows = {}
+            for row in self.env.cr.fetchall():
+                rows.setdefault(row[0], []).append(AccuracyRow(*row[1:]))
+            for loc in chunk:
+                yield loc, rows.get(loc.id, [])
+
     @api.model
     def _get_location_data(self, locations):
-        data = dict()
-        inventory_obj = self.env["stock.inventory"]
-        for loc in locations:
-            counts = inventory_obj.search(self._get_inventory_domain(loc.id))
-            data[loc] = counts
-        return data
-
-    @api.multi
-    def render_html(self, data=None):
-        report_obj = self.env["report"]
-        locs = self.env["stock.location"].browse(self._ids)
-        data = self._get_location_data(locs)
-        docargs = {
-            "doc_ids": locs._ids,
+        return {loc.id: rows
+                for loc, rows in self._iter_location_data(locations)}
+
+    @api.model
+    def _get_report_values(self, docids, data=None):
+        locs = self.env["stock.location"].browse(docids)
+        return {
+            "doc_ids": locs.ids,
+            "doc_model": "stock.location",
             "docs": locs,
-            "data": data,
+            "history": self._iter_location_data(locs),
         }
-        return report_obj.render(
-            "stock_cycle_count.stock_location_accuracy", docargs)
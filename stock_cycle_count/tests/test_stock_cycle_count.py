@@ -1,6 +1,7 @@
 # Copyright 2017 Eficent Business and IT Consulting Services S.L.
 #   (http://www.eficent.com)
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
+from odoo import fields
 from odoo.tests import common
 from odoo.exceptions import ValidationError
 from odoo.exceptions import AccessError
@@ -274,3 +275,251 @@ class TestStockCycleCount(common.TransactionCase):
         with self.assertRaises(ValidationError):
             self.zero_rule.warehouse_ids = [
                 (4, self.small_wh.id)]
+
+    def test_rule_periodic(self):
+        """Tests a location already counted is proposed again after the
+        period of the rule."""
+        loc = self.big_wh.lot_stock_id
+        inventory_date = datetime.today() - timedelta(days=1)
+        self.inventory_model.create({
+            'name': 'Previous inventory',
+            'location_id': loc.id,
+            'date': inventory_date,
+        })
+        proposal, = self.rule_periodic.compute_rule(loc)
+        self.assertEqual(proposal['location'], loc)
+        # 2 counts every 7 days
+        self.assertEqual(
+            proposal['date'].replace(microsecond=0),
+            (inventory_date + timedelta(days=3.5)).replace(microsecond=0))
+
+    def test_rule_turnover(self):
+        """Tests the turnover computed per location, with and without the
+        rolling counter."""
+        loc = self.big_wh.lot_stock_id
+        self.inventory_model.create({
+            'name': 'Pre-existing inventory',
+            'location_id': loc.id,
+            'date': datetime.today() - timedelta(days=1),
+        })
+        self.product1.standard_price = 60.0
+        self.quant_model.create({
+            'product_id': self.product1.id,
+            'location_id': self.count_loc.id,
+            'quantity': 3.0,
+        })
+
+        def move_in(qty):
+            move = self.stock_move_model.create({
+                'name': 'Turnover move',
+                'product_id': self.product1.id,
+                'product_uom_qty': qty,
+                'product_uom': self.product1.uom_id.id,
+                'location_id': self.count_loc.id,
+                'location_dest_id': loc.id,
+            })
+            move._action_confirm()
+            move._action_assign()
+            move.move_line_ids[0].qty_done = qty
+            move._action_done()
+            return move
+
+        move1 = move_in(1.0)
+        self.assertFalse(self.rule_turnover.compute_rule(loc))
+        self.rule_turnover.turnover_rolling_counter = True
+        self.assertFalse(self.rule_turnover.compute_rule(loc))
+        self.assertEqual(
+            loc.cycle_count_turnover,
+            self.stock_cycle_count_rule_model._compute_turnover(move1))
+        move2 = move_in(1.0)
+        self.assertEqual(
+            loc.cycle_count_turnover,
+            self.stock_cycle_count_rule_model._compute_turnover(move1) +
+            self.stock_cycle_count_rule_model._compute_turnover(move2))
+        # Both modes value the moves the same way
+        rule_model = self.stock_cycle_count_rule_model
+        dates = rule_model._get_latest_inventory_dates(loc)
+        self.assertAlmostEqual(
+            rule_model._get_turnover_values(dates)[loc.id],
+            loc.cycle_count_turnover)
+        self.assertTrue(self.rule_turnover.compute_rule(loc))
+        self.rule_turnover.turnover_rolling_counter = False
+        self.assertTrue(self.rule_turnover.compute_rule(loc))
+
+    def test_loc_accuracy(self):
+        """Tests the stored location accuracy, updated when the inventories
+        are validated."""
+        loc = self.big_wh.lot_stock_id
+        self.quant_model.create({
+            'product_id': self.product1.id,
+            'location_id': loc.id,
+            'quantity': 10.0,
+        })
+        self.assertEqual(loc.loc_accuracy, 0.0)
+
+        def count(qty):
+            inventory = self.inventory_model.create({
+                'name': 'Accuracy inventory',
+                'location_id': loc.id,
+                'filter': 'product',
+                'product_id': self.product1.id,
+            })
+            inventory.action_start()
+            inventory.line_ids.product_qty = qty
+            inventory.action_validate()
+            return inventory
+
+        inventory_1 = count(10.0)
+        self.assertEqual(inventory_1.inventory_accuracy, 100.0)
+        self.assertEqual(loc.loc_accuracy, 100.0)
+        inventory_2 = count(5.0)
+        self.assertEqual(inventory_2.inventory_accuracy, 50.0)
+        # Only the latest inventory is used by default
+        self.assertEqual(loc.loc_accuracy, 50.0)
+        self.big_wh.counts_for_accuracy_qty = 2
+        self.assertEqual(loc.loc_accuracy, 75.0)
+        self.rule_accuracy.accuracy_threshold = 80.0
+        proposed = self.rule_accuracy.compute_rule(loc)
+        self.assertEqual([p['location'] for p in proposed], [loc])
+        self.rule_accuracy.accuracy_threshold = 70.0
+        self.assertFalse(self.rule_accuracy.compute_rule(loc))
+
+    def test_cycle_count_jobs(self):
+        """Tests the split of the planner in jobs and shards."""
+        self.big_wh.cycle_count_jobs = 2
+        jobs = self.stock_warehouse_model._get_cycle_count_jobs()
+        self.assertIn((self.big_wh, (0, 2)), jobs)
+        self.assertIn((self.big_wh, (1, 2)), jobs)
+        self.assertIn((self.small_wh, None), jobs)
+        shards = self.stock_warehouse_model._get_cycle_count_jobs(0, 2) + \
+            self.stock_warehouse_model._get_cycle_count_jobs(1, 2)
+        self.assertEqual(sorted(shards, key=str), sorted(jobs, key=str))
+        shelf = self.stock_location_model.create({
+            'name': 'Shelf',
+            'location_id': self.big_wh.lot_stock_id.id,
+        })
+        locs = self.big_wh._search_cycle_count_locations(self.rule_periodic)
+        locs_0 = self.big_wh.with_context(
+            cycle_count_location_shard=(0, 2),
+        )._search_cycle_count_locations(self.rule_periodic)
+        locs_1 = self.big_wh.with_context(
+            cycle_count_location_shard=(1, 2),
+        )._search_cycle_count_locations(self.rule_periodic)
+        self.assertFalse(locs_0 & locs_1)
+        self.assertEqual(locs_0 | locs_1, locs)
+        # A subtree is planned by a single job
+        self.assertEqual(shelf in locs_0, self.big_wh.lot_stock_id in locs_0)
+        for shard in range(2):
+            self.stock_warehouse_model.cron_cycle_count(
+                shard=shard, shard_count=2)
+        counts = self.cycle_count_model.search([
+            ('location_id', 'in', locs.ids)])
+        self.assertEqual(counts.mapped('location_id'), locs)
+        # The capacity of a warehouse is leveled by a single job
+        self.big_wh.cycle_count_daily_capacity = 10
+        self.assertIn(
+            (self.big_wh, None),
+            self.stock_warehouse_model._get_cycle_count_jobs())
+
+    def test_zero_confirmation_batch(self):
+        """Tests the zero-confirmations of several locations at once."""
+        stock = self.big_wh.lot_stock_id
+        empty_locs = self.stock_location_model.create([{
+            'name': 'Empty %s' % i,
+            'location_id': stock.id,
+            'usage': 'internal',
+        } for i in range(2)])
+        stocked_loc = self.stock_location_model.create({
+            'name': 'Stocked',
+            'location_id': stock.id,
+            'usage': 'internal',
+        })
+        disabled_loc = self.stock_location_model.create({
+            'name': 'Disabled',
+            'location_id': stock.id,
+            'usage': 'internal',
+            'zero_confirmation_disabled': True,
+        })
+        other_wh_loc = self.small_wh.lot_stock_id
+        self.quant_model.create({
+            'product_id': self.product1.id,
+            'location_id': stocked_loc.id,
+            'quantity': 1.0,
+        })
+        planned = self.cycle_count_model.create({
+            'name': 'To be cancelled by the zero-confirmation.',
+            'cycle_count_rule_id': self.rule_periodic.id,
+            'location_id': empty_locs[0].id,
+            'date_deadline': datetime.today() + timedelta(days=1),
+        })
+        locs = empty_locs | stocked_loc | disabled_loc | other_wh_loc
+        locs.check_zero_confirmation()
+        counts = self.cycle_count_model.search([
+            ('location_id', 'in', locs.ids),
+            ('cycle_count_rule_id', '=', self.zero_rule.id)])
+        self.assertEqual(counts.mapped('location_id'), empty_locs)
+        self.assertEqual(planned.state, 'cancelled')
+
+    def test_cycle_count_capacity(self):
+        """Tests the leveling of the cycle counts with the daily capacity of
+        the warehouse."""
+        wh = self.small_wh
+        wh.write({
+            'cycle_count_planning_horizon': 30,
+            'cycle_count_daily_capacity': 2,
+        })
+        locs = self.stock_location_model.create([{
+            'name': 'Bin %s' % i,
+            'location_id': wh.lot_stock_id.id,
+            'usage': 'internal',
+        } for i in range(5)])
+        self.rule_turnover.sequence = 1
+        proposed = [
+            self.rule_periodic._propose_cycle_count(datetime.today(), loc)
+            for loc in locs[:4]]
+        proposed.append(
+            self.rule_turnover._propose_cycle_count(datetime.today(), locs[4]))
+        wh._plan_cycle_counts(proposed)
+        counts = self.cycle_count_model.search([
+            ('location_id', 'in', locs.ids)])
+        self.assertEqual(len(counts), 5)
+        today = fields.Date.context_today(wh)
+        dates = {cc.location_id: cc.date_deadline for cc in counts}
+        # The most urgent rule is planned first
+        self.assertEqual(dates[locs[4]], today)
+        self.assertEqual(sorted(dates.values()), [
+            today, today,
+            today + timedelta(days=1), today + timedelta(days=1),
+            today + timedelta(days=2)])
+
+    def test_location_accuracy_report(self):
+        """Tests the data of the location accuracy report."""
+        loc = self.big_wh.lot_stock_id
+        self.quant_model.create({
+            'product_id': self.product1.id,
+            'location_id': loc.id,
+            'quantity': 4.0,
+        })
+        inventory = self.inventory_model.create({
+            'name': 'Reported inventory',
+            'location_id': loc.id,
+            'filter': 'product',
+            'product_id': self.product1.id,
+            'exclude_sublocation': True,
+        })
+        inventory.action_start()
+        inventory.line_ids.product_qty = 3.0
+        inventory.action_validate()
+        report_model = self.env[
+            'report.stock_cycle_count.stock_location_accuracy']
+        history = report_model._get_location_data(loc | self.count_loc)
+        self.assertEqual(history[self.count_loc.id], [])
+        row, = history[loc.id]
+        self.assertEqual(row.name, 'Reported inventory')
+        self.assertEqual(row.theoretical_qty, 4.0)
+        self.assertEqual(row.discrepancy_qty, 1.0)
+        self.assertEqual(row.accuracy, 75.0)
+        html = self.env.ref(
+            'stock_cycle_count.action_report_stock_location_accuracy'
+        ).render_qweb_html(loc.ids)[0]
+        self.assertIn(b'Reported inventory', html)
@@ -41,8 +41,10 @@ class StockInventoryLine(models.Model):
 
     @api.multi
     def _compute_discrepancy_threshold(self):
+        warehouses = self.mapped('location_id')._get_location_warehouses()
         for line in self:
-            whs = line.location_id.get_warehouse()
+            whs = warehouses.get(
+                line.location_id.id, self.env['stock.warehouse'])
             if line.location_id.discrepancy_threshold > 0.0:
                 line.discrepancy_threshold = line.location_id.\
                     discrepancy_threshold
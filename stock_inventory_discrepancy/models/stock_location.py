@@ -2,7 +2,9 @@
 #   (http://www.eficent.com)
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from odoo import api, fields, models
+
+WAREHOUSE_CACHE = 'stock_inventory_discrepancy_warehouses'
 
 
 class StockLocation(models.Model):
@@ -14,3 +16,66 @@ class StockLocation(models.Model):
         help="Maximum Discrepancy Rate allowed for any product when doing "
              "an Inventory Adjustment. Thresholds defined in Locations have "
              "preference over Warehouse's ones.")
+
+    @api.model
+    def _get_warehouse_cache(self):
+        """ Return the warehouse resolution cache of the current
+        transaction """
+        cr = self.env.cr
+        cache = cr.cache.get(WAREHOUSE_CACHE)
+        if cache is None:
+            cache = cr.cache[WAREHOUSE_CACHE] = {}
+            for event in ('commit', 'rollback'):
+                cr.after(event, self._invalidate_warehouse_cache)
+        return cache
+
+    @api.model
+    def _invalidate_warehouse_cache(self):
+        """ Called whenever a location is moved or a warehouse changes """
+        self.env.cr.cache.pop(WAREHOUSE_CACHE, None)
+
+    @api.model
+    def _get_warehouse_view_paths(self):
+        """ Return the parent path of the view location of the warehouses
+        with their id, in the order `get_warehouse` looks them up """
+        cache = self._get_warehouse_cache()
+        if 'view_paths' not in cache:
+            self.env.cr.execute("""
+                SELECT v.parent_path, w.id
+                FROM stock_warehouse w
+                JOIN stock_location v ON v.id = w.view_location_id
+                WHERE w.active
+                ORDER BY w.sequence, w.id
+            """)
+            cache['view_paths'] = tuple(self.env.cr.fetchall())
+        return cache['view_paths']
+
+    @api.model
+    def _get_warehouse_id_from_parent_path(self, parent_path):
+        warehouse_ids = self._get_warehouse_cache().setdefault(
+            'warehouse_ids', {})
+        if parent_path not in warehouse_ids:
+            warehouse_ids[parent_path] = next((
+                wh_id for view_path, wh_id in self._get_warehouse_view_paths()
+                if parent_path.startswith(view_path)), False)
+        return warehouse_ids[parent_path]
+
+    @api.multi
+    def _get_location_warehouses(self):
+        """ Return the warehouse of each location, as `get_warehouse` does,
+        resolved in bulk through a cache keyed on their parent path.
+        :return: dict {location_id: warehouse}
+        """
+        warehouse_model = self.env['stock.warehouse']
+        return {
+            loc.id: warehouse_model.browse(
+                self._get_warehouse_id_from_parent_path(loc.parent_path or ''))
+            for loc in self}
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockLocation, self).write(vals)
+        if 'location_id' in vals:
+            # Moving locations changes their parent path
+            self._invalidate_warehouse_cache()
+        return res
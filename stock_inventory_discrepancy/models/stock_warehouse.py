@@ -2,7 +2,7 @@
 #   (http://www.eficent.com)
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl.html).
 
-from odoo import fields, models
+from odoo import api, fields, models
 
 
 class StockWarehouse(models.Model):
@@ -14,3 +14,23 @@ class StockWarehouse(models.Model):
         help="Maximum Discrepancy Rate allowed for any product when doing "
              "an Inventory Adjustment. Threshold defined in involved Location "
              "has preference.")
+
+    @api.model
+    def create(self, vals):
+        res = super(StockWarehouse, self).create(vals)
+        # Clear the location to warehouse resolution cache
+        self.env['stock.location']._invalidate_warehouse_cache()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockWarehouse, self).write(vals)
+        if {'view_location_id', 'sequence', 'active'} & set(vals):
+            self.env['stock.location']._invalidate_warehouse_cache()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(StockWarehouse, self).unlink()
+        self.env['stock.location']._invalidate_warehouse_cache()
+        return res
@@ -170,3 +170,21 @@ class TestInventoryDiscrepancy(TransactionCase):
         })
         with self.assertRaises(UserError):
             upd_qty.change_product_qty()
+
+    def test_location_warehouses(self):
+        """Tests the bulk resolution of the warehouse of the locations."""
+        locations = self.test_loc | self.test_wh.lot_stock_id | \
+            self.test_wh.view_location_id
+        self.assertEqual(
+            locations._get_location_warehouses(), {
+                self.test_loc.id: self.obj_wh,
+                self.test_wh.lot_stock_id.id: self.test_wh,
+                self.test_wh.view_location_id.id: self.test_wh,
+            })
+        # Moving a location updates its warehouse
+        self.test_loc.location_id = self.test_wh.lot_stock_id
+        self.assertEqual(
+            self.test_loc._get_location_warehouses()[self.test_loc.id],
+            self.test_wh)
+        self.assertEqual(self.test_loc._get_location_warehouses(), {
+            self.test_loc.id: self.test_loc.get_warehouse()})
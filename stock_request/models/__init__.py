@@ -12,3 +12,5 @@ from . import stock_warehouse
 from . import stock_location
 from . import stock_location_route
 from . import res_company
+from . import product_category
+from . import product_template
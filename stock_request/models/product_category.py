@@ -0,0 +1,16 @@
+# Copyright 2017 Eficent Business and IT Consulting Services, S.L.
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl.html).
+
+from odoo import api, models
+
+
+class ProductCategory(models.Model):
+    _inherit = 'product.category'
+
+    @api.multi
+    def write(self, vals):
+        res = super(ProductCategory, self).write(vals)
+        if {'route_ids', 'parent_id'} & set(vals):
+            # Clear the route resolution cache of the stock requests
+            self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
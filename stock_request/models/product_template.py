@@ -0,0 +1,16 @@
+# Copyright 2017 Eficent Business and IT Consulting Services, S.L.
+# License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl.html).
+
+from odoo import api, models
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    @api.multi
+    def write(self, vals):
+        res = super(ProductTemplate, self).write(vals)
+        if 'route_ids' in vals:
+            # Clear the route resolution cache of the stock requests
+            self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
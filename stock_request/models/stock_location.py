@@ -8,6 +8,14 @@ from odoo.exceptions import ValidationError
 class StockLocation(models.Model):
     _inherit = 'stock.location'
 
+    @api.multi
+    def write(self, vals):
+        res = super(StockLocation, self).write(vals)
+        if 'location_id' in vals:
+            # Moving locations changes the routes of their stock requests
+            self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
     @api.constrains('company_id')
     def _check_company_stock_request(self):
         if any(rec.company_id and self.env['stock.request'].search(
@@ -8,6 +8,25 @@ from odoo.exceptions import ValidationError
 class StockLocationRoute(models.Model):
     _inherit = 'stock.location.route'
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(StockLocationRoute, self).create(vals_list)
+        # Clear the route resolution cache of the stock requests
+        self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockLocationRoute, self).write(vals)
+        self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(StockLocationRoute, self).unlink()
+        self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
     @api.constrains('company_id')
     def _check_company_stock_request(self):
         if any(rec.company_id and self.env['stock.request'].search(
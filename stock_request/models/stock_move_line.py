@@ -1,6 +1,8 @@
 # Copyright 2017 Eficent Business and IT Consulting Services S.L.
 # License LGPL-3.0 or later (http://www.gnu.org/licenses/lgpl-3.0).
 
+from collections import OrderedDict, defaultdict
+
 from odoo import _, api, models
 
 
@@ -26,6 +28,16 @@ class StockMoveLine(models.Model):
         message += '</ul>'
         return message
 
+    @api.model
+    def _stock_request_confirm_done_messages_content(self, message_data):
+        """ Build the single message of the items of a request received
+        with a picking, from the message of each item.
+        :param message_data: list of the message data of each item
+        """
+        return ''.join(
+            self._stock_request_confirm_done_message_content(item_data)
+            for item_data in message_data)
+
     def _prepare_message_data(self, ml, request, allocated_qty):
         return {
             'request_name': request.name,
@@ -36,29 +48,57 @@ class StockMoveLine(models.Model):
             'location_name': ml.location_dest_id.name_get()[0][1],
         }
 
-    def _action_done(self):
-        res = super(StockMoveLine, self)._action_done()
-        for ml in self.filtered(
-                lambda m: m.exists() and m.move_id.allocation_ids):
+    def _stock_request_allocate(self):
+        """ Allocate the done quantities of the move lines to their stock
+        requests in a single pass, then write each allocation once, post
+        one message per request and picking, and check once whether each
+        request is done.
+        """
+        allocated = OrderedDict()
+        messages = OrderedDict()
+        for ml in self:
             qty_done = ml.product_uom_id._compute_quantity(
                 ml.qty_done, ml.product_id.uom_id)
 
             # We do sudo because potentially the user that completes the move
             #  may not have permissions for stock.request.
-            to_allocate_qty = ml.qty_done
             for allocation in ml.move_id.allocation_ids.sudo():
                 allocated_qty = 0.0
-                if allocation.open_product_qty:
-                    allocated_qty = min(
-                        allocation.open_product_qty, qty_done)
-                    allocation.allocated_product_qty += allocated_qty
-                    to_allocate_qty -= allocated_qty
+                current_qty = allocated.get(
+                    allocation, allocation.allocated_product_qty)
+                open_qty = max(
+                    allocation.requested_product_qty - current_qty, 0.0)
+                if open_qty:
+                    allocated_qty = min(open_qty, qty_done)
+                    allocated[allocation] = current_qty + allocated_qty
+                    qty_done -= allocated_qty
                 request = allocation.stock_request_id
-                message_data = self._prepare_message_data(ml, request,
-                                                          allocated_qty)
-                message = \
-                    self._stock_request_confirm_done_message_content(
-                        message_data)
-                request.message_post(body=message, subtype='mail.mt_comment')
-                request.check_done()
+                messages.setdefault((request, ml.picking_id), []).append(
+                    self._prepare_message_data(ml, request, allocated_qty))
+        allocations_by_qty = defaultdict(
+            lambda: self.env['stock.request.allocation'].sudo())
+        for allocation, allocated_qty in allocated.items():
+            allocations_by_qty[allocated_qty] |= allocation
+        for allocated_qty, allocations in allocations_by_qty.items():
+            allocations.with_context(recompute=False).write(
+                {'allocated_product_qty': allocated_qty})
+        # Update the quantities of the requests with a single query, then
+        # the other fields depending on the allocations
+        self.env['stock.request.allocation'].sudo().browse(
+            [allocation.id for allocation in allocated]
+        ).mapped('stock_request_id')._recompute_qty()
+        self.recompute()
+        requests = self.env['stock.request'].sudo()
+        for (request, picking), message_data in messages.items():
+            message = self._stock_request_confirm_done_messages_content(
+                message_data)
+            request.message_post(body=message, subtype='mail.mt_comment')
+            requests |= request
+        requests.check_done()
+
+    def _action_done(self):
+        res = super(StockMoveLine, self)._action_done()
+        self.filtered(
+            lambda m: m.exists() and m.move_id.allocation_ids
+        )._stock_request_allocate()
         return res
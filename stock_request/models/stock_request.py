@@ -1,6 +1,8 @@
 # Copyright 2017 Eficent Business and IT Consulting Services, S.L.
 # License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl.html).
 
+from collections import OrderedDict
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 from odoo.addons import decimal_precision as dp
@@ -65,14 +67,20 @@ class StockRequest(models.Model):
         states={'draft': [('readonly', False)]},
         default='direct',
     )
-    move_ids = fields.One2many(comodel_name='stock.move',
-                               compute='_compute_move_ids',
-                               string='Stock Moves', readonly=True,
-                               )
-    picking_ids = fields.One2many('stock.picking',
-                                  compute='_compute_picking_ids',
-                                  string='Pickings', readonly=True,
-                                  )
+    move_ids = fields.Many2many(comodel_name='stock.move',
+                                relation='stock_request_stock_move_rel',
+                                column1='request_id', column2='move_id',
+                                compute='_compute_move_ids', store=True,
+                                compute_sudo=True,
+                                string='Stock Moves', readonly=True,
+                                )
+    picking_ids = fields.Many2many('stock.picking',
+                                   relation='stock_request_stock_picking_rel',
+                                   column1='request_id', column2='picking_id',
+                                   compute='_compute_picking_ids', store=True,
+                                   compute_sudo=True,
+                                   string='Pickings', readonly=True,
+                                   )
     qty_in_progress = fields.Float(
         'Qty In Progress', digits=dp.get_precision('Product Unit of Measure'),
         readonly=True, compute='_compute_qty', store=True,
@@ -85,6 +93,7 @@ class StockRequest(models.Model):
     )
     picking_count = fields.Integer(string='Delivery Orders',
                                    compute='_compute_picking_ids',
+                                   store=True, compute_sudo=True,
                                    readonly=True,
                                    )
     allocation_ids = fields.One2many(comodel_name='stock.request.allocation',
@@ -124,33 +133,106 @@ class StockRequest(models.Model):
          'Stock Request name must be unique'),
     ]
 
-    @api.depends('allocation_ids')
+    @api.depends('allocation_ids', 'allocation_ids.stock_move_id')
     def _compute_move_ids(self):
         for request in self:
             request.move_ids = request.allocation_ids.mapped('stock_move_id')
 
-    @api.depends('allocation_ids')
+    @api.depends('allocation_ids', 'allocation_ids.stock_move_id',
+                 'allocation_ids.stock_move_id.state',
+                 'allocation_ids.stock_move_id.picking_id')
     def _compute_picking_ids(self):
         for request in self:
-            request.picking_count = 0
-            request.picking_ids = self.env['stock.picking']
-            request.picking_ids = request.move_ids.filtered(
+            request.picking_ids = request.allocation_ids.mapped(
+                'stock_move_id').filtered(
                 lambda m: m.state != 'cancel').mapped('picking_id')
             request.picking_count = len(request.picking_ids)
 
-    @api.depends('allocation_ids', 'allocation_ids.stock_move_id.state',
-                 'allocation_ids.stock_move_id.move_line_ids',
-                 'allocation_ids.stock_move_id.move_line_ids.qty_done')
+    @api.multi
+    def _get_qty_aggregates(self):
+        """ Return the done and open quantities of the requests, in the UoM
+        of their product, summed over their allocations in a single grouped
+        query. The open quantity of an allocation is its requested quantity,
+        converted as `_compute_quantity` does, minus its allocated quantity.
+        :return: dict {request_id: (done qty, open qty)}
+        """
+        if not self.ids:
+            return {}
+        self.env.cr.execute("""
+            SELECT a.stock_request_id,
+                COALESCE(SUM(a.allocated_product_qty), 0.0),
+                COALESCE(SUM(CASE WHEN m.state = 'cancel' THEN 0.0
+                    ELSE GREATEST(CEIL(ROUND((
+                        a.requested_product_uom_qty / ru.factor * pu.factor
+                        / pu.rounding)::numeric, 6)) * pu.rounding
+                        - a.allocated_product_qty, 0.0) END), 0.0)
+            FROM stock_request_allocation a
+            JOIN stock_move m ON m.id = a.stock_move_id
+            JOIN stock_request r ON r.id = a.stock_request_id
+            JOIN uom_uom ru ON ru.id = r.product_uom_id
+            JOIN product_product p ON p.id = r.product_id
+            JOIN product_template t ON t.id = p.product_tmpl_id
+            JOIN uom_uom pu ON pu.id = t.uom_id
+            WHERE a.stock_request_id IN %s
+            GROUP BY a.stock_request_id
+        """, (tuple(self.ids),))
+        return {
+            request_id: (float(done_qty), float(open_qty))
+            for request_id, done_qty, open_qty in self.env.cr.fetchall()}
+
+    @api.multi
+    def _get_qty_values(self):
+        """ Return the done and in progress quantities of the requests, in
+        their UoM.
+        :return: dict {request_id: (qty_done, qty_in_progress)}
+        """
+        aggregates = self.filtered('id')._get_qty_aggregates()
+        res = {}
+        for request in self:
+            if request.id:
+                done_qty, open_qty = aggregates.get(request.id, (0.0, 0.0))
+            else:
+                done_qty = sum(request.allocation_ids.mapped(
+                    'allocated_product_qty'))
+                open_qty = sum(request.allocation_ids.mapped(
+                    'open_product_qty'))
+            uom = request.product_id.uom_id
+            res[request.id] = (
+                uom._compute_quantity(done_qty, request.product_uom_id),
+                uom._compute_quantity(open_qty, request.product_uom_id))
+        return res
+
+    @api.depends('allocation_ids', 'allocation_ids.allocated_product_qty',
+                 'allocation_ids.requested_product_uom_qty',
+                 'allocation_ids.stock_move_id.state')
     def _compute_qty(self):
+        values = self._get_qty_values()
         for request in self:
-            done_qty = sum(request.allocation_ids.mapped(
-                'allocated_product_qty'))
-            open_qty = sum(request.allocation_ids.mapped('open_product_qty'))
-            request.qty_done = request.product_id.uom_id._compute_quantity(
-                done_qty, request.product_uom_id)
-            request.qty_in_progress = \
-                request.product_id.uom_id._compute_quantity(
-                    open_qty, request.product_uom_id)
+            request.qty_done, request.qty_in_progress = values[request.id]
+
+    @api.multi
+    def _recompute_qty(self):
+        """ Recompute the quantities of the requests in batch, applied with
+        a single multi-row update instead of the write of each request by
+        the ORM """
+        if not self.ids:
+            return
+        for fname in ('qty_done', 'qty_in_progress'):
+            self.env.remove_todo(self._fields[fname], self)
+        values = self._get_qty_values()
+        self.env.cr.execute("""
+            UPDATE stock_request
+            SET qty_done = qty.qty_done,
+                qty_in_progress = qty.qty_in_progress
+            FROM (
+                SELECT UNNEST(%s::integer[]) AS id,
+                    UNNEST(%s::float8[]) AS qty_done,
+                    UNNEST(%s::float8[]) AS qty_in_progress
+            ) AS qty
+            WHERE stock_request.id = qty.id
+        """, (self.ids, [values[request_id][0] for request_id in self.ids],
+              [values[request_id][1] for request_id in self.ids]))
+        self.invalidate_cache(['qty_done', 'qty_in_progress'], self.ids)
 
     @api.constrains('order_id', 'requested_by')
     def check_order_requested_by(self):
@@ -210,7 +292,7 @@ class StockRequest(models.Model):
     @api.multi
     def _action_confirm(self):
         self._action_launch_procurement_rule()
-        self.state = 'open'
+        self.write({'state': 'open'})
 
     @api.multi
     def action_confirm(self):
@@ -266,6 +348,54 @@ class StockRequest(models.Model):
         return self.state != 'draft' or \
             self.product_id.type not in ('consu', 'product')
 
+    def _get_procurement_batch_key(self):
+        """ Requests sharing this key resolve to the same procurement rule,
+        so their moves can be created together """
+        return (self.product_id, self.location_id, self.route_id,
+                self.procurement_group_id, self.warehouse_id, self.company_id)
+
+    def _get_procurement_origin(self):
+        return self.order_id.name or self.name
+
+    @api.multi
+    def _run_procurement(self):
+        """ Launch the procurement of a single request """
+        self.ensure_one()
+        values = self._prepare_procurement_values(
+            group_id=self.procurement_group_id)
+        # We launch with sudo because potentially we could create
+        # objects that the user is not authorized to create, such
+        # as PO.
+        self.env['procurement.group'].sudo().run(
+            self.product_id, self.product_uom_qty,
+            self.product_uom_id,
+            self.location_id, self.name,
+            self.name, values)
+
+    @api.multi
+    def _run_procurement_batch(self):
+        """ Launch the procurement of requests sharing the same batch key.
+        When they are pulled by a stock rule, the rule is resolved once and
+        all their moves are created and confirmed together.
+        :return: False if the rule cannot pull the requests in batch
+        """
+        procurements = []
+        for request in self:
+            values = request._prepare_procurement_values(
+                group_id=request.procurement_group_id)
+            values.setdefault(
+                'company_id', self.env['res.company']._company_default_get(
+                    'procurement.group'))
+            values.setdefault('priority', '1')
+            procurements.append((request, values))
+        first, values = procurements[0]
+        rule = self.env['procurement.group'].sudo()._get_rule(
+            first.product_id, first.location_id, values)
+        if not rule or rule.action not in ('pull', 'pull_push'):
+            return False
+        rule._run_pull_stock_requests(procurements)
+        return True
+
     @api.multi
     def _action_launch_procurement_rule(self):
         """
@@ -274,10 +404,13 @@ class StockRequest(models.Model):
         stock request. procurement group will launch '_run_move',
         '_run_buy' or '_run_manufacture'
         depending on the stock request product rule.
+        The requests pulled by the same stock rule are launched in batch,
+        falling back to one by one when the batch fails, so that the error
+        of each request is reported.
         """
         precision = self.env['decimal.precision'].precision_get(
             'Product Unit of Measure')
-        errors = []
+        batches = OrderedDict()
         for request in self:
             if request._skip_procurement():
                 continue
@@ -289,20 +422,24 @@ class StockRequest(models.Model):
             if float_compare(qty, request.product_qty,
                              precision_digits=precision) >= 0:
                 continue
-
-            values = request._prepare_procurement_values(
-                group_id=request.procurement_group_id)
-            try:
-                # We launch with sudo because potentially we could create
-                # objects that the user is not authorized to create, such
-                # as PO.
-                self.env['procurement.group'].sudo().run(
-                    request.product_id, request.product_uom_qty,
-                    request.product_uom_id,
-                    request.location_id, request.name,
-                    request.name, values)
-            except UserError as error:
-                errors.append(error.name)
+            key = request._get_procurement_batch_key()
+            batches[key] = batches.get(key, self.browse()) | request
+        errors = []
+        for requests in batches.values():
+            if len(requests) > 1:
+                try:
+                    with self.env.cr.savepoint():
+                        if requests._run_procurement_batch():
+                            continue
+                except UserError:
+                    # the savepoint discarded the moves and allocations
+                    # created by the batch, drop them from the cache too
+                    self.invalidate_cache()
+            for request in requests:
+                try:
+                    request._run_procurement()
+                except UserError as error:
+                    errors.append(error.name)
         if errors:
             raise UserError('\n'.join(errors))
         return True
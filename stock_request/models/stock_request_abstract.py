@@ -5,6 +5,8 @@ from odoo import api, fields, models, _
 from odoo.exceptions import ValidationError
 from odoo.addons import decimal_precision as dp
 
+ROUTE_CACHE = 'stock_request_routes'
+
 
 class StockRequest(models.AbstractModel):
     _name = "stock.request.abstract"
@@ -97,22 +99,52 @@ class StockRequest(models.AbstractModel):
     @api.depends('product_id', 'warehouse_id', 'location_id')
     def _compute_route_ids(self):
         route_obj = self.env['stock.location.route']
-        for wh in self.mapped('warehouse_id'):
-            wh_routes = route_obj.search(
-                [('warehouse_ids', '=', wh.id)])
-            for record in self.filtered(lambda r: r.warehouse_id == wh):
-                routes = route_obj
-                if record.product_id:
-                    routes += record.product_id.mapped(
-                        'route_ids'
-                    ) | record.product_id.mapped(
-                        'categ_id'
-                    ).mapped('total_route_ids')
-                if record.warehouse_id:
-                    routes |= wh_routes
-                parents = record.get_parents().ids
-                record.route_ids = routes.filtered(lambda r: any(
-                    p.location_id.id in parents for p in r.rule_ids))
+        for record in self:
+            if not record.warehouse_id:
+                record.route_ids = route_obj
+                continue
+            record.route_ids = route_obj.browse(
+                self._get_route_candidate_ids(
+                    record.warehouse_id.id, record.product_id.id,
+                    record.product_id.categ_id.id,
+                    record.location_id.parent_path or ''))
+
+    @api.model
+    def _get_route_candidate_ids(self, warehouse_id, product_id, categ_id,
+                                 parent_path):
+        """ Return the ids of the routes of the warehouse and the product
+        having a rule that ends in the location of the given parent path or
+        in one of its parents. The result is cached in the current
+        transaction until a route, a rule, a location or the routes of a
+        product change.
+        """
+        cr = self.env.cr
+        cache = cr.cache.get(ROUTE_CACHE)
+        if cache is None:
+            cache = cr.cache[ROUTE_CACHE] = {}
+            for event in ('commit', 'rollback'):
+                cr.after(event, self._invalidate_route_cache)
+        key = (self.env.uid, self.env.user.company_id.id, warehouse_id,
+               product_id, categ_id, parent_path)
+        if key in cache:
+            return cache[key]
+        route_obj = self.env['stock.location.route']
+        routes = route_obj.search([('warehouse_ids', '=', warehouse_id)])
+        if product_id:
+            product = self.env['product.product'].browse(product_id)
+            routes |= product.route_ids | \
+                self.env['product.category'].browse(
+                    categ_id).total_route_ids
+        cache[key] = tuple(routes.filtered(lambda r: any(
+            rule.location_id.parent_path and
+            parent_path.startswith(rule.location_id.parent_path)
+            for rule in r.rule_ids)).ids)
+        return cache[key]
+
+    @api.model
+    def _invalidate_route_cache(self):
+        """ Called whenever the routes of the stock requests may change """
+        self.env.cr.cache.pop(ROUTE_CACHE, None)
 
     def get_parents(self):
         location = self.location_id
@@ -86,16 +86,22 @@ class StockRequestOrder(models.Model):
         states={'draft': [('readonly', False)]},
         default='direct',
     )
-    move_ids = fields.One2many(comodel_name='stock.move',
-                               compute='_compute_move_ids',
-                               string='Stock Moves', readonly=True,
-                               )
-    picking_ids = fields.One2many('stock.picking',
-                                  compute='_compute_picking_ids',
-                                  string='Pickings', readonly=True,
-                                  )
+    move_ids = fields.Many2many(comodel_name='stock.move',
+                                relation='stock_request_order_stock_move_rel',
+                                column1='order_id', column2='move_id',
+                                compute='_compute_move_ids', store=True,
+                                compute_sudo=True,
+                                string='Stock Moves', readonly=True,
+                                )
+    picking_ids = fields.Many2many(
+        'stock.picking', relation='stock_request_order_stock_picking_rel',
+        column1='order_id', column2='picking_id',
+        compute='_compute_picking_ids', store=True, compute_sudo=True,
+        string='Pickings', readonly=True,
+    )
     picking_count = fields.Integer(string='Delivery Orders',
                                    compute='_compute_picking_ids',
+                                   store=True, compute_sudo=True,
                                    readonly=True,
                                    )
     stock_request_ids = fields.One2many(
@@ -114,13 +120,13 @@ class StockRequestOrder(models.Model):
          'Stock Request name must be unique'),
     ]
 
-    @api.depends('stock_request_ids.allocation_ids')
+    @api.depends('stock_request_ids.picking_ids')
     def _compute_picking_ids(self):
         for record in self:
             record.picking_ids = record.stock_request_ids.mapped('picking_ids')
             record.picking_count = len(record.picking_ids)
 
-    @api.depends('stock_request_ids')
+    @api.depends('stock_request_ids.move_ids')
     def _compute_move_ids(self):
         for record in self:
             record.move_ids = record.stock_request_ids.mapped('move_ids')
@@ -201,9 +207,8 @@ class StockRequestOrder(models.Model):
 
     @api.multi
     def action_confirm(self):
-        for line in self.stock_request_ids:
-            line.action_confirm()
-        self.state = 'open'
+        self.mapped('stock_request_ids').action_confirm()
+        self.write({'state': 'open'})
         return True
 
     def action_draft(self):
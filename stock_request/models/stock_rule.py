@@ -1,12 +1,32 @@
 # Copyright 2017 Eficent Business and IT Consulting Services, S.L.
 # License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl.html).
 
-from odoo import models
+from odoo import api, models, _
+from odoo.exceptions import UserError
 
 
 class StockRule(models.Model):
     _inherit = 'stock.rule'
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        res = super(StockRule, self).create(vals_list)
+        # Clear the route resolution cache of the stock requests
+        self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
+    @api.multi
+    def write(self, vals):
+        res = super(StockRule, self).write(vals)
+        self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
+    @api.multi
+    def unlink(self):
+        res = super(StockRule, self).unlink()
+        self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
     def _get_stock_move_values(self, product_id, product_qty, product_uom,
                                location_id, name, origin, values, group_id):
         result = super(StockRule, self)._get_stock_move_values(
@@ -18,3 +38,32 @@ class StockRule(models.Model):
                 'requested_product_uom_qty': product_qty,
             })]
         return result
+
+    @api.multi
+    def _run_pull_stock_requests(self, procurements):
+        """ Create and confirm at once the moves pulling the products of
+        several stock requests, as `_run_pull` does for each of them.
+        :param procurements: list of (stock request, procurement values)
+        """
+        self.ensure_one()
+        if not self.location_src_id:
+            msg = _('No source location defined on stock rule: %s!') % (
+                self.name, )
+            raise UserError(msg)
+        move_values = []
+        for request, values in procurements:
+            group_id = False
+            if self.group_propagation_option == 'propagate':
+                group_id = values.get('group_id', False) and \
+                    values['group_id'].id
+            elif self.group_propagation_option == 'fixed':
+                group_id = self.group_id.id
+            move_values.append(self._get_stock_move_values(
+                request.product_id, request.product_uom_qty,
+                request.product_uom_id, request.location_id, request.name,
+                request._get_procurement_origin(), values, group_id))
+        moves = self.env['stock.move'].sudo().with_context(
+            force_company=move_values[0].get('company_id', False),
+        ).create(move_values)
+        moves._action_confirm()
+        return True
@@ -8,6 +8,14 @@ from odoo.exceptions import ValidationError
 class StockWarehouse(models.Model):
     _inherit = 'stock.warehouse'
 
+    @api.multi
+    def write(self, vals):
+        res = super(StockWarehouse, self).write(vals)
+        if 'route_ids' in vals:
+            # Clear the route resolution cache of the stock requests
+            self.env['stock.request.abstract']._invalidate_route_cache()
+        return res
+
     @api.constrains('company_id')
     def _check_company_stock_request(self):
         if any(self.env['stock.request'].search(
@@ -4,6 +4,7 @@
 from odoo.tests import common
 from odoo import fields, exceptions
 from collections import Counter
+from unittest import mock
 from datetime import datetime
 
 
@@ -295,6 +296,31 @@ class TestStockRequestBase(TestStockRequest):
         self.assertEqual(
             stock_request.location_id, self.warehouse.lot_stock_id)
 
+    def test_route_ids_cache(self):
+        def get_route_ids(location):
+            return self.stock_request.new({
+                'product_id': self.product.id,
+                'warehouse_id': self.warehouse.id,
+                'location_id': location.id,
+            }).route_ids.ids
+
+        stock_loc = self.warehouse.lot_stock_id
+        self.assertNotIn(self.route.id, get_route_ids(stock_loc))
+        # The cached routes are refreshed when the product routes change
+        self.product.route_ids = [(6, 0, self.route.ids)]
+        self.assertIn(self.route.id, get_route_ids(stock_loc))
+        # Rules ending in a parent of the request location supply it
+        shelf_loc = self.env['stock.location'].create({
+            'name': 'Shelf',
+            'location_id': self.warehouse.view_location_id.id,
+        })
+        self.assertNotIn(self.route.id, get_route_ids(shelf_loc))
+        shelf_loc.location_id = stock_loc
+        self.assertIn(self.route.id, get_route_ids(shelf_loc))
+        # But rules ending in a child of the request location do not
+        self.route.rule_ids.write({'location_id': shelf_loc.id})
+        self.assertNotIn(self.route.id, get_route_ids(stock_loc))
+
     def test_stock_request_order_validations_01(self):
         """ Testing the discrepancy in warehouse_id between
         stock request and order"""
@@ -590,6 +616,38 @@ class TestStockRequestBase(TestStockRequest):
                          stock_request.product_uom_qty)
         self.assertEqual(stock_request.state, 'done')
 
+    def test_recompute_qty(self):
+        """The quantities of the requests are recomputed in batch"""
+        vals = {
+            'product_id': self.product.id,
+            'product_uom_id': self.uom_dozen.id,
+            'product_uom_qty': 2.0,
+            'company_id': self.main_company.id,
+            'warehouse_id': self.warehouse.id,
+            'location_id': self.warehouse.lot_stock_id.id,
+        }
+        stock_request = self.stock_request.create(vals)
+        self.product.route_ids = [(6, 0, self.route.ids)]
+        stock_request.action_confirm()
+        self.assertEqual(stock_request.qty_in_progress, 2.0)
+        self.env['stock.quant'].create({
+            'product_id': self.product.id,
+            'location_id': self.ressuply_loc.id,
+            'quantity': 24.0})
+        picking = stock_request.picking_ids
+        picking.action_assign()
+        picking.move_line_ids.qty_done = 24.0
+        picking.action_done()
+        self.assertEqual(stock_request.qty_done, 2.0)
+        self.assertEqual(stock_request.qty_in_progress, 0.0)
+        self.env.cr.execute(
+            "UPDATE stock_request SET qty_done = 0, qty_in_progress = 2 "
+            "WHERE id = %s", (stock_request.id, ))
+        stock_request.invalidate_cache()
+        stock_request._recompute_qty()
+        self.assertEqual(stock_request.qty_done, 2.0)
+        self.assertEqual(stock_request.qty_in_progress, 0.0)
+
     def test_create_request_03(self):
         """Multiple stock requests"""
         vals = {
@@ -625,6 +683,156 @@ class TestStockRequestBase(TestStockRequest):
         packout1.qty_done = 10
         picking.action_done()
 
+    def test_create_request_batch(self):
+        """Confirm an order with several lines pulled by the same rule"""
+        expected_date = fields.Datetime.now()
+        product_2 = self._create_product('SH3', 'Sandals', False)
+        line_vals = {
+            'product_uom_qty': 2.0,
+            'company_id': self.main_company.id,
+            'warehouse_id': self.warehouse.id,
+            'location_id': self.warehouse.lot_stock_id.id,
+            'expected_date': expected_date,
+        }
+        vals = {
+            'company_id': self.main_company.id,
+            'warehouse_id': self.warehouse.id,
+            'location_id': self.warehouse.lot_stock_id.id,
+            'expected_date': expected_date,
+            'stock_request_ids': [(0, 0, dict(
+                line_vals, product_id=product.id,
+                product_uom_id=product.uom_id.id,
+            )) for product in (self.product, self.product, product_2)]
+        }
+        order = self.request_order.sudo(
+            self.stock_request_user).create(vals)
+        (self.product | product_2).write({
+            'route_ids': [(6, 0, self.route.ids)]})
+        order.action_confirm()
+        self.assertEqual(order.state, 'open')
+        self.assertEqual(
+            order.stock_request_ids.mapped('state'), ['open'] * 3)
+        self.assertEqual(len(order.sudo().picking_ids), 1)
+        self.assertEqual(order.sudo().picking_ids.origin, order.name)
+        moves = order.sudo().move_ids
+        self.assertEqual(
+            sum(moves.filtered(
+                lambda m: m.product_id == self.product
+            ).mapped('product_uom_qty')), 4.0)
+        for request in order.stock_request_ids:
+            self.assertEqual(request.qty_in_progress, 2.0)
+
+    def test_create_request_batch_fallback(self):
+        """A batch failing after creating moves falls back one by one"""
+        expected_date = fields.Datetime.now()
+        vals = {
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'product_uom_qty': 2.0,
+            'company_id': self.main_company.id,
+            'warehouse_id': self.warehouse.id,
+            'location_id': self.warehouse.lot_stock_id.id,
+            'expected_date': expected_date,
+        }
+        self.product.write({'route_ids': [(6, 0, self.route.ids)]})
+        requests = self.stock_request.sudo(self.stock_request_user).create(
+            vals) | self.stock_request.sudo(self.stock_request_user).create(
+            dict(vals, product_uom_qty=3.0))
+        rule_class = type(self.env['stock.rule'])
+        run_pull = rule_class._run_pull_stock_requests
+
+        def run_pull_and_fail(rule, procurements):
+            run_pull(rule, procurements)
+            raise exceptions.UserError('Batch failure')
+
+        with mock.patch.object(
+                rule_class, '_run_pull_stock_requests', run_pull_and_fail):
+            requests.action_confirm()
+        self.assertEqual(requests.mapped('state'), ['open'] * 2)
+        for request, qty in zip(requests.sudo(), (2.0, 3.0)):
+            self.assertEqual(
+                request.move_ids, request.move_ids.exists())
+            self.assertEqual(len(request.allocation_ids), 1)
+            self.assertEqual(
+                request.allocation_ids.requested_product_uom_qty, qty)
+            self.assertEqual(request.qty_in_progress, qty)
+
+    def test_allocation_messages(self):
+        """One receipt message is posted per request and picking"""
+        vals = {
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'product_uom_qty': 4.0,
+            'company_id': self.main_company.id,
+            'warehouse_id': self.warehouse.id,
+            'location_id': self.warehouse.lot_stock_id.id,
+        }
+        requests = self.stock_request.create(vals) | \
+            self.stock_request.create(dict(vals, product_uom_qty=2.0))
+        self.product.route_ids = [(6, 0, self.route.ids)]
+        requests.action_confirm()
+        picking = requests.mapped('picking_ids')
+        self.assertEqual(len(picking), 1)
+        self.env['stock.quant'].create({
+            'product_id': self.product.id,
+            'location_id': self.ressuply_loc.id,
+            'quantity': 6.0})
+        picking.action_assign()
+        for move_line in picking.move_line_ids:
+            move_line.qty_done = move_line.product_uom_qty
+        picking.action_done()
+        for request in requests:
+            self.assertEqual(request.state, 'done')
+            self.assertEqual(request.qty_done, request.product_uom_qty)
+            messages = request.message_ids.filtered(
+                lambda m: 'Receipt confirmation' in (m.body or ''))
+            self.assertEqual(len(messages), 1)
+
+    def test_create_request_batch_error(self):
+        """Each request failing in a batch is reported"""
+        vals = {
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'product_uom_qty': 1.0,
+            'company_id': self.main_company.id,
+            'warehouse_id': self.warehouse.id,
+            'location_id': self.ressuply_loc.id,
+        }
+        requests = self.stock_request.create(vals) | \
+            self.stock_request.create(vals)
+        with self.assertRaises(exceptions.UserError) as error:
+            requests.action_confirm()
+        self.assertEqual(
+            error.exception.name.count(self.product.display_name), 2)
+
+    def test_search_open_pickings(self):
+        """The pickings of the requests are stored and searchable"""
+        vals = {
+            'product_id': self.product.id,
+            'product_uom_id': self.product.uom_id.id,
+            'product_uom_qty': 3.0,
+            'company_id': self.main_company.id,
+            'warehouse_id': self.warehouse.id,
+            'location_id': self.warehouse.lot_stock_id.id,
+        }
+        stock_request = self.stock_request.create(vals)
+        self.product.route_ids = [(6, 0, self.route.ids)]
+        stock_request.action_confirm()
+        picking = stock_request.picking_ids
+        self.assertEqual(stock_request.picking_count, 1)
+        domain = [('picking_ids.state', 'not in', ['done', 'cancel'])]
+        self.assertIn(stock_request, self.stock_request.search(domain))
+        self.assertEqual(self.stock_request.search(
+            [('move_ids', 'in', picking.move_lines.ids)]), stock_request)
+        self.env['stock.quant'].create({
+            'product_id': self.product.id,
+            'location_id': self.ressuply_loc.id,
+            'quantity': 3.0})
+        picking.action_assign()
+        picking.move_line_ids.qty_done = 3.0
+        picking.action_done()
+        self.assertNotIn(stock_request, self.stock_request.search(domain))
+
     def test_cancel_request(self):
         expected_date = fields.Datetime.now()
         vals = {
@@ -8,12 +8,17 @@ class PurchaseOrder(models.Model):
     _inherit = 'purchase.order'
 
     stock_request_ids = fields.Many2many(comodel_name='stock.request',
+                                         relation='purchase_stock_request_rel',
+                                         column1='purchase_id',
+                                         column2='request_id',
                                          string='Stock Requests',
-                                         compute='_compute_stock_request_ids')
+                                         compute='_compute_stock_request_ids',
+                                         store=True, compute_sudo=True)
     stock_request_count = fields.Integer('Stock Request #',
-                                         compute='_compute_stock_request_ids')
+                                         compute='_compute_stock_request_ids',
+                                         store=True, compute_sudo=True)
 
-    @api.depends('order_line')
+    @api.depends('order_line', 'order_line.stock_request_ids')
     def _compute_stock_request_ids(self):
         for rec in self:
             rec.stock_request_ids = rec.order_line.mapped('stock_request_ids')
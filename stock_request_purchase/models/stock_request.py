@@ -8,17 +8,22 @@ from odoo.exceptions import ValidationError
 class StockRequest(models.Model):
     _inherit = "stock.request"
 
-    purchase_ids = fields.One2many('purchase.order',
-                                   compute='_compute_purchase_ids',
-                                   string='Purchase Orders', readonly=True)
+    purchase_ids = fields.Many2many('purchase.order',
+                                    relation='stock_request_purchase_rel',
+                                    column1='request_id',
+                                    column2='purchase_id',
+                                    compute='_compute_purchase_ids',
+                                    store=True, compute_sudo=True,
+                                    string='Purchase Orders', readonly=True)
     purchase_count = fields.Integer(string='Purchase count',
                                     compute='_compute_purchase_ids',
+                                    store=True, compute_sudo=True,
                                     readonly=True)
     purchase_line_ids = fields.Many2many('purchase.order.line',
                                          string='Purchase Order Lines',
                                          readonly=True, copy=False)
 
-    @api.depends('purchase_line_ids')
+    @api.depends('purchase_line_ids', 'purchase_line_ids.order_id')
     def _compute_purchase_ids(self):
         for request in self:
             request.purchase_ids = request.purchase_line_ids.mapped('order_id')
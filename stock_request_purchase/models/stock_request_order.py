@@ -7,18 +7,24 @@ from odoo import api, fields, models
 class StockRequestOrder(models.Model):
     _inherit = 'stock.request.order'
 
-    purchase_ids = fields.One2many('purchase.order',
-                                   compute='_compute_purchase_ids',
-                                   string='Purchase Orders', readonly=True)
+    purchase_ids = fields.Many2many(
+        'purchase.order', relation='stock_request_order_purchase_rel',
+        column1='order_id', column2='purchase_id',
+        compute='_compute_purchase_ids', store=True, compute_sudo=True,
+        string='Purchase Orders', readonly=True)
     purchase_count = fields.Integer(string='Purchase count',
                                     compute='_compute_purchase_ids',
+                                    store=True, compute_sudo=True,
                                     readonly=True)
-    purchase_line_ids = fields.Many2many('purchase.order.line',
-                                         compute='_compute_purchase_ids',
-                                         string='Purchase Order Lines',
-                                         readonly=True, copy=False)
+    purchase_line_ids = fields.Many2many(
+        'purchase.order.line',
+        relation='stock_request_order_purchase_line_rel',
+        column1='order_id', column2='purchase_line_id',
+        compute='_compute_purchase_ids', store=True, compute_sudo=True,
+        string='Purchase Order Lines', readonly=True, copy=False)
 
-    @api.depends('stock_request_ids')
+    @api.depends('stock_request_ids.purchase_ids',
+                 'stock_request_ids.purchase_line_ids')
     def _compute_purchase_ids(self):
         for req in self:
             req.purchase_ids = req.stock_request_ids.mapped('purchase_ids')